@@ -1,47 +1,49 @@
 import sys
 import os
+import queue
 import random
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QLabel, QLineEdit, QPushButton, QVBoxLayout, QHBoxLayout, QGridLayout, QFileDialog, QComboBox, QSpinBox, QSlider, QPlainTextEdit, QProgressBar, QFrame, QGraphicsView, QListWidget)
-from PyQt5.QtCore import QThread, pyqtSignal, pyqtSlot
-import moviepy.editor as mpe
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QLabel, QLineEdit, QPushButton, QVBoxLayout, QHBoxLayout, QGridLayout, QFileDialog, QComboBox, QSpinBox, QSlider, QPlainTextEdit, QProgressBar, QFrame, QGraphicsView, QListWidget, QCheckBox, QGraphicsScene, QGraphicsPixmapItem, QListWidgetItem)
+from PyQt5.QtCore import Qt, QThread, pyqtSignal, pyqtSlot
+from PyQt5.QtGui import QImage, QPixmap
+
+from vedit_core import (VideoEngine, Watermark, SubtitleRenderer, FrameCache, PreviewSource, ProxyBuilder, JobScheduler,
+                        CACHE_FOLDER_NAME, JOB_STATES, SUBTITLE_STYLES, list_system_fonts, parse_concat_time,
+                        resolve_profiles)
 
 class VideoHeaderProcessor(QThread):
-    """视频片头拼接处理线程。"""
+    """视频片头拼接处理线程，实际处理由 VideoEngine 完成。"""
     progress_updated = pyqtSignal(int)  # 定义进度更新信号
+    message_logged = pyqtSignal(str)  # 日志信号，跨线程安全地更新界面
+    event_emitted = pyqtSignal(object)  # 结构化事件信号（阶段、文件、进度）
 
     def __init__(self, parent=None):
         super().__init__(parent)
         self.header_file = ''
         self.output_folder = ''
-        self._is_paused = False  # 添加暂停标志
+        self.engine = VideoEngine(log=self.log_message, progress=self.progress_updated.emit,
+                                  events=self.event_emitted.emit)
 
-    def set_parameters(self, header_file, output_folder):
+    def set_parameters(self, header_file, output_folder, workers=0, profiles=None):
         """设置处理参数。"""
         self.header_file = header_file
         self.output_folder = output_folder
+        self.engine.workers = workers
+        self.engine.profiles = resolve_profiles(profiles)
+        self.engine.resume()  # 重置暂停标志
 
     def run(self):
         """线程执行函数。"""
-        print("开始拼接片头...")  # 添加调试信息
-        self.concat_header(self.header_file, self.output_folder)
-        print("拼接片头完成！")  # 添加调试信息
-
-    def concat_header(self, header_file, output_folder):
-        """将片头与文件夹中的视频拼接。"""
-        header_clip = mpe.VideoFileClip(header_file)
-
-        for file_name in os.listdir(output_folder):
-            if file_name.startswith('final_'):
-                video_path = os.path.join(output_folder, file_name)
-                video_clip = mpe.VideoFileClip(video_path)
-                final_clip = mpe.concatenate_videoclips([header_clip, video_clip])
-                final_clip_name = f"final_{file_name}"
-                print(f"正在生成最终视频: {final_clip_name}")  # 添加调试信息
-                final_clip.write_videofile(os.path.join(output_folder, final_clip_name))
+        self.log_message("开始拼接片头...")  # 添加调试信息
+        self.engine.concat_header(self.header_file, self.output_folder)
+        self.log_message("拼接片头完成！")  # 添加调试信息
+
+    def log_message(self, message):
+        """通过信号把日志信息输出到界面。"""
+        self.message_logged.emit(message)
 
     def pause(self):
-        """暂停处理并清除缓存。"""
-        self._is_paused = True
+        """停止处理并清除缓存，已停止的任务不能继续，需要暂停后继续时使用作业队列。"""
+        self.engine.pause()
         self.progress_updated.emit(0)  # 清除进度条
         self.clear_cache()  # 清除视频缓存
 
@@ -51,184 +53,299 @@ class VideoHeaderProcessor(QThread):
         self.output_folder = ''
 
 class VideoProcessor(QThread):
-    """视频处理线程。"""
+    """视频处理线程，实际处理由 VideoEngine 完成。"""
     progress_updated = pyqtSignal(int)  # 定义进度更新信号
+    message_logged = pyqtSignal(str)  # 日志信号，跨线程安全地更新界面
+    event_emitted = pyqtSignal(object)  # 结构化事件信号（阶段、文件、进度）
 
     def __init__(self, parent=None):
         super().__init__(parent)
         self.clip_folder = ''
         self.output_folder = ''
         self.concat_time = 0
-        self.operation = ''  # 添加操作标志：'clip' 或 'concat'
-        self._is_paused = False  # 添加暂停标志
-        self.parent = parent  # 添加对父类的引用
+        self.header_file = ''
+        self.operation = ''  # 添加操作标志：'clip'、'concat' 或 'render'（拼接并加片头，一次编码）
+        self.engine = VideoEngine(log=self.log_message, progress=self.progress_updated.emit,
+                                  events=self.event_emitted.emit)
 
-    def set_parameters(self, clip_folder, output_folder, concat_time, operation):
+    def set_parameters(self, clip_folder, output_folder, concat_time, operation, frame_exact=False, workers=0,
+                       seed=None, transition_duration=0, profiles=None, segment_mode='random', header_file=''):
         """设置处理参数。"""
         self.clip_folder = clip_folder
         self.output_folder = output_folder
         self.concat_time = concat_time
+        self.header_file = header_file
         self.operation = operation
+        self.engine.frame_exact = frame_exact
+        self.engine.workers = workers
+        self.engine.seed = seed if seed is not None else random.randrange(2 ** 32)  # 每次运行重新随机片段边界
+        self.engine.transition_duration = transition_duration
+        self.engine.profiles = resolve_profiles(profiles)
+        self.engine.segment_mode = segment_mode
+        self.engine.resume()  # 重置暂停标志
 
     def run(self):
         """线程执行函数。"""
         if self.operation == 'clip':
             self.log_message("开始剪辑视频...")  # 添加调试信息
-            self.clip_videos(self.clip_folder, self.output_folder)
+            self.engine.clip_videos(self.clip_folder, self.output_folder)
             self.log_message("剪辑视频完成！")  # 添加调试信息
         elif self.operation == 'concat':
             self.log_message("开始拼接视频...")  # 添加调试信息
-            self.concat_videos(self.output_folder, self.concat_time)
+            self.engine.concat_videos(self.output_folder, self.concat_time)
             self.log_message("拼接视频完成！")  # 添加调试信息
+        elif self.operation == 'render':
+            self.log_message("开始拼接视频并添加片头...")  # 添加调试信息
+            self.engine.render(self.output_folder, self.concat_time, self.header_file)
+            self.log_message("拼接视频并添加片头完成！")  # 添加调试信息
 
     def log_message(self, message):
-        """将日志信息输出到父类的UI。"""
-        if self.parent:
-            self.parent.log_message(message)
+        """通过信号把日志信息输出到界面。"""
+        self.message_logged.emit(message)
+
+    def pause(self):
+        """停止处理并清除缓存，已停止的任务不能继续，需要暂停后继续时使用作业队列。"""
+        self.engine.pause()
+        self.progress_updated.emit(0)  # 清除进度条
+        self.clear_cache()  # 清除视频缓存
+
+    def clear_cache(self):
+        """清除视频缓存。"""
+        self.clip_folder = ''
+        self.output_folder = ''
+
+class AudioProcessor(QThread):
+    """背景音乐批处理线程，实际处理由 VideoEngine 完成。"""
+    progress_updated = pyqtSignal(int)  # 定义进度更新信号
+    message_logged = pyqtSignal(str)  # 日志信号，跨线程安全地更新界面
+    event_emitted = pyqtSignal(object)  # 结构化事件信号（阶段、文件、进度）
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.video_folder = ''
+        self.music_file = ''
+        self.voice_file = ''
+        self.volume = 0
+        self.engine = VideoEngine(log=self.log_message, progress=self.progress_updated.emit,
+                                  events=self.event_emitted.emit)
+
+    def set_parameters(self, video_folder, music_file, voice_file, volume, workers=0):
+        """设置处理参数，volume 为 0~1 的背景音乐音量。"""
+        self.video_folder = video_folder
+        self.music_file = music_file
+        self.voice_file = voice_file
+        self.volume = volume
+        self.engine.workers = workers
+        self.engine.resume()  # 重置暂停标志
 
     def run(self):
         """线程执行函数。"""
-        if self.operation == 'clip':
-            print("开始剪辑视频...")  # 添加调试信息
-            self.clip_videos(self.clip_folder, self.output_folder)
-            print("剪辑视频完成！")  # 添加调试信息
-        elif self.operation == 'concat':
-            print("开始拼接视频...")  # 添加调试信息
-            self.concat_videos(self.output_folder, self.concat_time)
-            print("拼接视频完成！")  # 添加调试信息
-
-    def clip_videos(self, clip_folder, output_folder):
-        """将文件夹中的视频剪辑成3~5秒的片段。"""
-        total_clips = 0
-        for file_name in os.listdir(clip_folder):
-            if file_name.lower().endswith(('.mp4', '.avi', '.mov')):
-                video_path = os.path.join(clip_folder, file_name)
-                try:
-                    video = mpe.VideoFileClip(video_path)
-                    duration = int(video.duration)
-                    total_clips += (duration // 4) + (1 if duration % 4 > 0 else 0)  # 每 4 秒一个片段，最后可能有一个不足 4 秒的片段
-                except Exception as e:
-                    self.log_message(f"无法处理视频文件: {file_name}, 错误: {e}")
-
-        processed_clips = 0
-        for file_name in os.listdir(clip_folder):
-            if file_name.lower().endswith(('.mp4', '.avi', '.mov')):
-                self.log_message(f"正在处理视频文件: {file_name}")  # 添加调试信息
-                processed_clips += self.process_video(os.path.join(clip_folder, file_name), output_folder, total_clips,
-                                                      processed_clips)
-                progress = int((processed_clips / total_clips) * 100)
-                self.progress_updated.emit(progress)  # 更新进度条
-
-    def process_video(self, video_path, output_folder, total_clips, processed_clips):
-        """处理单个视频，将其剪辑成3~5秒的片段，无缝剪辑，不浪费任何一秒钟。"""
-        try:
-            video = mpe.VideoFileClip(video_path)
-            video = video.without_audio()  # 删除音轨
-        except Exception as e:
-            self.log_message(f"无法打开视频文件: {video_path}, 错误: {e}")
-            return 0
-
-        duration = int(video.duration)
-        start_time = 0
-        i = 0
-
-        while start_time < duration:  # 循环剪辑，直到处理完整个视频
-            if self._is_paused:  # 检查暂停标志
-                break
-
-            end_time = min(start_time + random.randint(3, 5), duration)
-            clip = video.subclip(start_time, end_time)
-            clip_name = f"{int(end_time - start_time)}s_{os.path.splitext(os.path.basename(video_path))[0]}_{int(start_time)}s~{int(end_time)}s.mp4"
-            self.log_message(f"正在剪辑片段: {clip_name}")  # 添加调试信息
-            try:
-                clip.write_videofile(os.path.join(output_folder, clip_name))
-            except Exception as e:
-                self.log_message(f"无法保存剪辑片段: {clip_name}, 错误: {e}")
-                continue
+        self.log_message("开始添加背景音乐...")  # 添加调试信息
+        self.engine.mix_audio(self.video_folder, self.music_file, self.voice_file, self.volume)
+        self.log_message("添加背景音乐完成！")  # 添加调试信息
 
-            start_time = end_time  # 下一个片段从当前片段的结束时间开始
-            i += 1
-            processed_clips += 1
-            progress = int((processed_clips / total_clips) * 100)
-            self.progress_updated.emit(progress)  # 发送进度更新信号
-
-        return i  # 返回处理的片段数量
-
-    def concat_videos(self, output_folder, concat_time):
-        """将剪辑后的片段拼接成指定长度的视频，并添加随机转场效果。"""
-        clips = []
-        total_duration = 0
-
-        # 收集片段，确保总时长达到或超过指定的拼接时间
-        while total_duration < concat_time:
-            for file_name in os.listdir(output_folder):
-                if file_name.lower().startswith(('0s_', '1s_', '2s_', '3s_', '4s_', '5s_', '6s_', '7s_', '8s_', '9s_')):
-                    clip_path = os.path.join(output_folder, file_name)
-                    try:
-                        clip = mpe.VideoFileClip(clip_path)
-                        clips.append(clip)
-                        total_duration += clip.duration
-                        if total_duration >= concat_time:
-                            break
-                    except Exception as e:
-                        self.log_message(f"无法处理视频文件: {file_name}, 错误: {e}")
-
-        if total_duration < concat_time:
-            self.log_message("片段总时长不足拼接时间，将利用重复片段。")
-            while total_duration < concat_time:
-                clips.extend(clips)  # 重复片段
-                total_duration *= 2
-
-        random.shuffle(clips)  # 随机打乱片段顺序
-        final_clips = []
-        current_duration = 0
-
-        while current_duration < concat_time and clips:
-            clip = clips.pop(0)  # 使用pop(0)以确保顺序
-            final_clips.append(clip)
-            current_duration += clip.duration
-
-        # 如果当前时长仍不足，继续添加片段
-        while current_duration < concat_time:
-            for clip in clips:
-                if current_duration >= concat_time:
-                    break
-                final_clips.append(clip)
-                current_duration += clip.duration
-
-        # 拼接片段
-        total_clips = len(final_clips)
-        final_video = final_clips[0]
-        for i in range(1, total_clips):
-            transition = random.choice(['crossfadein', 'crossfadeout'])
-            try:
-                final_video = mpe.concatenate_videoclips([final_video, final_clips[i]], method="compose")
-            except Exception as e:
-                self.log_message(f"无法拼接视频片段: {i}, 错误: {e}")
-            progress = int((i / total_clips) * 100)
-            self.progress_updated.emit(progress)  # 更新进度条
+    def log_message(self, message):
+        """通过信号把日志信息输出到界面。"""
+        self.message_logged.emit(message)
 
-        final_video_name = "final_output.mp4"
-        self.log_message(f"正在生成最终视频: {final_video_name}")
-        try:
-            final_video.write_videofile(os.path.join(output_folder, final_video_name))
-            self.log_message("拼接视频完成！")
-        except Exception as e:
-            self.log_message(f"无法生成最终视频: {final_video_name}, 错误: {e}")
+    def pause(self):
+        """停止处理，已停止的任务不能继续，需要暂停后继续时使用作业队列。"""
+        self.engine.pause()
+        self.progress_updated.emit(0)  # 清除进度条
+
+class WatermarkProcessor(QThread):
+    """水印批处理线程，实际处理由 VideoEngine 完成。"""
+    progress_updated = pyqtSignal(int)  # 定义进度更新信号
+    message_logged = pyqtSignal(str)  # 日志信号，跨线程安全地更新界面
+    event_emitted = pyqtSignal(object)  # 结构化事件信号（阶段、文件、进度）
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.video_folder = ''
+        self.watermark = None
+        self.engine = VideoEngine(log=self.log_message, progress=self.progress_updated.emit,
+                                  events=self.event_emitted.emit)
+
+    def set_parameters(self, video_folder, watermark, workers=0, profiles=None):
+        """设置处理参数。"""
+        self.video_folder = video_folder
+        self.watermark = watermark
+        self.engine.workers = workers
+        self.engine.profiles = resolve_profiles(profiles)
+        self.engine.resume()  # 重置暂停标志
 
+    def run(self):
+        """线程执行函数。"""
+        self.log_message("开始添加水印...")  # 添加调试信息
+        self.engine.watermark_videos(self.video_folder, self.watermark)
+        self.log_message("添加水印完成！")  # 添加调试信息
+
+    def log_message(self, message):
+        """通过信号把日志信息输出到界面。"""
+        self.message_logged.emit(message)
 
     def pause(self):
-        """暂停处理并清除缓存。"""
-        self._is_paused = True
+        """停止处理，已停止的任务不能继续，需要暂停后继续时使用作业队列。"""
+        self.engine.pause()
         self.progress_updated.emit(0)  # 清除进度条
-        self.clear_cache()  # 清除视频缓存
 
-    def clear_cache(self):
-        """清除视频缓存。"""
-        self.clip_folder = ''
-        self.output_folder = ''
+class SubtitleProcessor(QThread):
+    """字幕批处理线程，实际处理由 VideoEngine 完成。"""
+    progress_updated = pyqtSignal(int)  # 定义进度更新信号
+    message_logged = pyqtSignal(str)  # 日志信号，跨线程安全地更新界面
+    event_emitted = pyqtSignal(object)  # 结构化事件信号（阶段、文件、进度）
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.video_folder = ''
+        self.renderer = None
+        self.engine = VideoEngine(log=self.log_message, progress=self.progress_updated.emit,
+                                  events=self.event_emitted.emit)
+
+    def set_parameters(self, video_folder, renderer, workers=0, profiles=None):
+        """设置处理参数。"""
+        self.video_folder = video_folder
+        self.renderer = renderer
+        self.engine.workers = workers
+        self.engine.profiles = resolve_profiles(profiles)
+        self.engine.resume()  # 重置暂停标志
+
+    def run(self):
+        """线程执行函数。"""
+        self.log_message("开始烧录字幕...")  # 添加调试信息
+        self.engine.burn_subtitles(self.video_folder, self.renderer)
+        self.log_message("烧录字幕完成！")  # 添加调试信息
+
+    def log_message(self, message):
+        """通过信号把日志信息输出到界面。"""
+        self.message_logged.emit(message)
+
+    def pause(self):
+        """停止处理，已停止的任务不能继续，需要暂停后继续时使用作业队列。"""
+        self.engine.pause()
+        self.progress_updated.emit(0)  # 清除进度条
+
+class JobQueueThread(QThread):
+    """作业队列线程：JobScheduler 在独立的进程中执行排队的作业，这里把日志、进度和状态转成 Qt 信号。"""
+    progress_updated = pyqtSignal(str, int)  # 作业名、进度
+    message_logged = pyqtSignal(str)  # 日志信号，跨线程安全地更新界面
+    event_emitted = pyqtSignal(object)  # 结构化事件信号（阶段、文件、进度）
+    status_changed = pyqtSignal(str, str)  # 作业名、状态
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.scheduler = JobScheduler(log=self.message_logged.emit,
+                                      progress=lambda name, value: self.progress_updated.emit(name, int(value)),
+                                      events=lambda name, event: self.event_emitted.emit(event),
+                                      status=self.status_changed.emit)
+        self.finished.connect(self.restart_if_pending)
+
+    def submit(self, job, priority=0):
+        """把作业加入队列，线程没有运行时启动线程，返回作业名。"""
+        name = self.scheduler.submit(job, priority)
+        if not self.isRunning():
+            self.start()
+        return name
+
+    def run(self):
+        """线程执行函数。"""
+        self.scheduler.run()
+
+    def restart_if_pending(self):
+        """线程结束时仍有作业（结束前刚提交的）则重新启动。"""
+        if self.scheduler.pending():
+            self.start()
+
+class PreviewWorker(QThread):
+    """预览线程：解码画面，空闲时预先解码播放头之后的帧，代理文件和缩略图条在另一个线程中生成。
+
+    拖动时只处理最新的请求，界面线程不会被解码阻塞。
+    """
+    frame_ready = pyqtSignal(object)  # 解码好的 rgb24 画面（numpy 数组）
+    duration_ready = pyqtSignal(float)  # 当前预览视频的时长
+    thumbnails_ready = pyqtSignal(str)  # 缩略图条的图片路径
+    message_logged = pyqtSignal(str)  # 日志信号，跨线程安全地更新界面
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.requests = queue.Queue()
+        self.frame_cache = FrameCache()
+        self.proxy_builder = ProxyBuilder(log=self.log_message)  # 只为最新选中的视频生成代理文件
+        self.source = None
+
+    def load(self, video_path):
+        """请求预览一个视频。"""
+        self.requests.put(('load', video_path))
+        if not self.isRunning():
+            self.start()
+
+    def seek(self, t):
+        """请求显示 t 秒处的画面。"""
+        self.requests.put(('seek', t))
+
+    def stop(self):
+        """结束线程，并结束正在生成的代理文件（删除其临时文件）。"""
+        self.requests.put(None)
+        self.wait()
+        self.proxy_builder.stop()
+
+    def run(self):
+        """线程执行函数。"""
+        playhead = None  # 需要预先解码的位置，None 表示附近的帧已全部缓存
+        while True:
+            try:
+                requests = [self.requests.get(timeout=None if playhead is None else 0.05)]
+            except queue.Empty:
+                try:
+                    if not self.source.prefetch(playhead):
+                        playhead = None
+                except Exception:
+                    playhead = None
+                continue
+            while not self.requests.empty():
+                requests.append(self.requests.get_nowait())
+            if None in requests:
+                return
+
+            loaded = False
+            seek = None
+            for kind, value in requests:  # 合并积压的请求，只处理最新的视频和位置
+                if kind == 'load':
+                    self.source = PreviewSource(value, self.frame_cache, self.proxy_builder,
+                                                on_ready=self.proxy_ready)
+                    loaded = True
+                    seek = 0.0
+                else:
+                    seek = value
+            if self.source is None:
+                continue
+            try:
+                if loaded:
+                    self.log_message(f"正在生成预览: {os.path.basename(self.source.video_path)}")  # 添加调试信息
+                    self.duration_ready.emit(self.source.open()['duration'])
+                if seek is not None:
+                    frame = self.source.frame_at(seek)
+                    if frame is not None:
+                        self.frame_ready.emit(frame)
+                    playhead = seek
+            except Exception as e:
+                self.log_message(f"无法预览视频: {os.path.basename(self.source.video_path)}, 错误: {e}")
+                playhead = None
+
+    def proxy_ready(self, source, strip_path):
+        """代理文件的生成线程完成后调用，已经切换到其他视频时不显示旧视频的缩略图条。"""
+        if source is self.source:
+            self.thumbnails_ready.emit(strip_path)
+
+    def log_message(self, message):
+        """通过信号把日志信息输出到界面。"""
+        self.message_logged.emit(message)
 
 class MainWindow(QMainWindow):
+    TRANSITION_DURATION = 0.5  # 随机转场的重叠时长（秒）
+    OUTPUT_PROFILES = [("成片(慢速高画质)", 'delivery'), ("草稿(快速低分辨率)", 'draft'),
+                       ("中间(快速)", 'intermediate'), ("无损(帧内)", 'lossless')]  # 拼接和片头输出的编码档位
+
     def __init__(self):
         super().__init__()
 
@@ -239,8 +356,43 @@ class MainWindow(QMainWindow):
         self.connect_signals()  # 连接信号与槽函数
         self.video_processor = VideoProcessor(self)  # 创建视频处理线程并传递对父类的引用
         self.video_processor.progress_updated.connect(self.update_progress)  # 连接进度更新信号
+        self.video_processor.message_logged.connect(self.log_message)  # 连接日志信号
+        self.video_processor.event_emitted.connect(self.handle_event)  # 连接事件信号
+        self.video_processor.finished.connect(lambda: self.process_video_button.setText("开始批处理视频"))
         self.video_header_processor = VideoHeaderProcessor()  # 创建视频片头拼接处理线程
         self.video_header_processor.progress_updated.connect(self.update_progress)  # 连接进度更新信号
+        self.video_header_processor.message_logged.connect(self.log_message)  # 连接日志信号
+        self.video_header_processor.event_emitted.connect(self.handle_event)  # 连接事件信号
+        self.video_header_processor.finished.connect(lambda: self.process_video_button.setText("开始批处理视频"))
+        self.audio_processor = AudioProcessor(self)  # 创建背景音乐处理线程
+        self.audio_processor.progress_updated.connect(self.update_progress)  # 连接进度更新信号
+        self.audio_processor.message_logged.connect(self.log_message)  # 连接日志信号
+        self.audio_processor.event_emitted.connect(self.handle_event)  # 连接事件信号
+        self.audio_processor.finished.connect(lambda: self.process_audio_button.setText("开始批处理音乐"))
+        self.watermark_processor = WatermarkProcessor(self)  # 创建水印处理线程
+        self.watermark_processor.progress_updated.connect(self.update_progress)  # 连接进度更新信号
+        self.watermark_processor.message_logged.connect(self.log_message)  # 连接日志信号
+        self.watermark_processor.event_emitted.connect(self.handle_event)  # 连接事件信号
+        self.watermark_processor.finished.connect(lambda: self.process_watermark_button.setText("开始批处理水印"))
+        self.subtitle_processor = SubtitleProcessor(self)  # 创建字幕处理线程
+        self.subtitle_processor.progress_updated.connect(self.update_progress)  # 连接进度更新信号
+        self.subtitle_processor.message_logged.connect(self.log_message)  # 连接日志信号
+        self.subtitle_processor.event_emitted.connect(self.handle_event)  # 连接事件信号
+        self.subtitle_processor.finished.connect(lambda: self.process_subtitle_button.setText("开始批处理字幕"))
+        self.job_progress = {}  # 作业名 -> 进度
+        self.job_queue = JobQueueThread(self)  # 创建作业队列线程
+        self.job_queue.progress_updated.connect(self.update_job_progress)
+        self.job_queue.message_logged.connect(self.log_message)  # 连接日志信号
+        self.job_queue.event_emitted.connect(self.handle_event)  # 连接事件信号
+        self.job_queue.status_changed.connect(self.update_job_status)
+        self.preview_duration = 0
+        self.preview_worker = PreviewWorker(self)  # 创建预览线程
+        self.preview_worker.frame_ready.connect(self.show_preview_frame)
+        self.preview_worker.duration_ready.connect(self.set_preview_duration)
+        self.preview_worker.thumbnails_ready.connect(self.show_thumbnails)
+        self.preview_worker.message_logged.connect(self.log_message)  # 连接日志信号
+        self.file_list.currentItemChanged.connect(self.preview_selected_file)
+        self.preview_slider.valueChanged.connect(self.seek_preview)
 
     def log_message(self, message):
         """将日志信息输出到UI。"""
@@ -262,13 +414,29 @@ class MainWindow(QMainWindow):
         self.progress_bar.setValue(0)  # 初始化进度条为0
         progressLayout.addWidget(self.progress_bar)
 
+        # 作业队列状态列表
+        self.job_list = QListWidget()
+        self.job_list.setMaximumHeight(120)
+        progressLayout.addWidget(self.job_list)
+
         # 中部分：视频预览窗口和功能栏
         middleLayout = QHBoxLayout()
 
         # 视频预览窗口
         videoPreviewLayout = QVBoxLayout()
         videoPreviewLayout.addWidget(QLabel("视频预览窗口"))
-        videoPreviewLayout.addWidget(QGraphicsView())  # 使用QGraphicsView来表示视频预览窗口
+        self.preview_scene = QGraphicsScene()
+        self.preview_item = QGraphicsPixmapItem()
+        self.preview_scene.addItem(self.preview_item)
+        self.preview_view = QGraphicsView(self.preview_scene)  # 使用QGraphicsView来表示视频预览窗口
+        videoPreviewLayout.addWidget(self.preview_view)
+        self.preview_slider = QSlider(Qt.Horizontal)  # 拖动预览位置
+        self.preview_slider.setRange(0, 1000)
+        videoPreviewLayout.addWidget(self.preview_slider)
+        self.thumbnail_label = QLabel()  # 缩略图条
+        videoPreviewLayout.addWidget(self.thumbnail_label)
+        self.file_list = QListWidget()  # 文件列表，选中后预览
+        videoPreviewLayout.addWidget(self.file_list)
 
         # 功能栏
         functionLayout = QGridLayout()
@@ -279,6 +447,8 @@ class MainWindow(QMainWindow):
         functionLayout.addWidget(self.clip_file_edit, 0, 1)
         self.clip_file_button = QPushButton("选择文件夹")
         functionLayout.addWidget(self.clip_file_button, 0, 2)
+        self.scene_checkbox = QCheckBox("按镜头切分")  # 优先在镜头切换处切分，默认随机切分
+        functionLayout.addWidget(self.scene_checkbox, 0, 3)
         functionLayout.addWidget(QLabel("添加片头"), 1, 0)
         self.add_header_edit = QLineEdit()
         functionLayout.addWidget(self.add_header_edit, 1, 1)
@@ -289,8 +459,16 @@ class MainWindow(QMainWindow):
         functionLayout.addWidget(self.concat_time_edit, 2, 1)
         self.concat_output_folder_button = QPushButton("选择文件夹")
         functionLayout.addWidget(self.concat_output_folder_button, 2, 2)
+        self.transition_checkbox = QCheckBox("随机转场(重新编码)")  # 不勾选时片段参数一致即可流复制拼接
+        functionLayout.addWidget(self.transition_checkbox, 3, 0)
         self.process_video_button = QPushButton("开始批处理视频")
         functionLayout.addWidget(self.process_video_button, 3, 1)
+        self.frame_exact_checkbox = QCheckBox("精确剪辑(重新编码)")  # 默认按关键帧流复制快速剪辑
+        functionLayout.addWidget(self.frame_exact_checkbox, 3, 2)
+        self.profile_combobox = QComboBox()  # 需要重新编码时，拼接和片头输出使用的编码档位
+        for text, profile in self.OUTPUT_PROFILES:
+            self.profile_combobox.addItem(text, profile)
+        functionLayout.addWidget(self.profile_combobox, 3, 3)
 
         # 音频处理
         functionLayout.addWidget(QLabel("视频"), 4, 0)
@@ -310,6 +488,8 @@ class MainWindow(QMainWindow):
         functionLayout.addWidget(self.subtitle_audio_button, 6, 2)
         functionLayout.addWidget(QLabel("音乐大小"), 7, 0)
         self.music_volume_spinbox = QSpinBox()  # 音量输入数字
+        self.music_volume_spinbox.setRange(0, 100)  # 背景音乐音量百分比
+        self.music_volume_spinbox.setValue(30)
         functionLayout.addWidget(self.music_volume_spinbox, 7, 1)
         self.audition_button = QPushButton("试听")
         functionLayout.addWidget(self.audition_button, 7, 2)
@@ -324,12 +504,17 @@ class MainWindow(QMainWindow):
         functionLayout.addWidget(self.subtitle_video_button, 9, 2)
         functionLayout.addWidget(QLabel("字体"), 10, 0)
         self.font_combobox = QComboBox()
+        for name, font_path in list_system_fonts().items():  # 显示字体名，保存字体文件路径
+            self.font_combobox.addItem(name, font_path)
         functionLayout.addWidget(self.font_combobox, 10, 1)
         functionLayout.addWidget(QLabel("大小"), 11, 0)
         self.font_size_spinbox = QSpinBox()
+        self.font_size_spinbox.setRange(12, 200)
+        self.font_size_spinbox.setValue(48)
         functionLayout.addWidget(self.font_size_spinbox, 11, 1)
         functionLayout.addWidget(QLabel("样式"), 12, 0)
         self.font_style_combobox = QComboBox()
+        self.font_style_combobox.addItems(list(SUBTITLE_STYLES))
         functionLayout.addWidget(self.font_style_combobox, 12, 1)
         self.process_subtitle_button = QPushButton("开始批处理字幕")
         functionLayout.addWidget(self.process_subtitle_button, 13, 1)
@@ -349,13 +534,27 @@ class MainWindow(QMainWindow):
         functionLayout.addWidget(self.watermark_image_button, 15, 2)
         functionLayout.addWidget(QLabel("位置"), 16, 0)
         self.watermark_position_edit = QLineEdit()
+        self.watermark_position_edit.setPlaceholderText("右下 / 左上 / 右上 / 左下 / 居中 / x,y")
         functionLayout.addWidget(self.watermark_position_edit, 16, 1)
         functionLayout.addWidget(QLabel("大小"), 17, 0)
         self.watermark_size_edit = QLineEdit()
+        self.watermark_size_edit.setPlaceholderText("15% / 200px / 200x100")
         functionLayout.addWidget(self.watermark_size_edit, 17, 1)
         self.process_watermark_button = QPushButton("开始批处理水印")
         functionLayout.addWidget(self.process_watermark_button, 18, 1)
 
+        # 作业队列：按上面填写的内容生成作业，多个批次可以同时排队执行
+        functionLayout.addWidget(QLabel("优先级"), 19, 0)
+        self.priority_spinbox = QSpinBox()  # 数字越大越先执行
+        self.priority_spinbox.setRange(0, 9)
+        functionLayout.addWidget(self.priority_spinbox, 19, 1)
+        self.enqueue_button = QPushButton("加入队列")
+        functionLayout.addWidget(self.enqueue_button, 19, 2)
+        self.pause_queue_button = QPushButton("暂停队列")
+        functionLayout.addWidget(self.pause_queue_button, 20, 1)
+        self.cancel_job_button = QPushButton("取消作业")  # 取消选中的作业，没有选中时取消全部作业
+        functionLayout.addWidget(self.cancel_job_button, 20, 2)
+
         middleLayout.addLayout(videoPreviewLayout)
         middleLayout.addLayout(functionLayout)
 
@@ -380,28 +579,79 @@ class MainWindow(QMainWindow):
         self.add_header_button.clicked.connect(self.select_header_file)
         self.concat_output_folder_button.clicked.connect(self.select_concat_output_folder)
         self.process_video_button.clicked.connect(self.toggle_video_processing)
+        self.audio_video_button.clicked.connect(self.select_audio_video_folder)
+        self.bg_music_button.clicked.connect(self.select_bg_music_file)
+        self.subtitle_audio_button.clicked.connect(self.select_subtitle_audio_file)
+        self.process_audio_button.clicked.connect(self.toggle_audio_processing)
+        self.process_watermark_button.clicked.connect(self.toggle_watermark_processing)
+        self.subtitle_video_button.clicked.connect(self.select_subtitle_video_folder)
+        self.process_subtitle_button.clicked.connect(self.toggle_subtitle_processing)
+        self.enqueue_button.clicked.connect(self.enqueue_jobs)
+        self.pause_queue_button.clicked.connect(self.toggle_queue_paused)
+        self.cancel_job_button.clicked.connect(self.cancel_jobs)
 
     def open_processed_folder(self):
         """打开处理后的文件夹。"""
         folder_path = QFileDialog.getExistingDirectory(self, "选择处理后的文件夹")
         if folder_path:
-            # 这里需要根据你的实际处理逻辑来显示处理后的文件
-            # 例如，如果处理后的文件与原始文件在同一文件夹下，只是文件名不同，
-            # 你可以在这里遍历文件夹，找到处理后的文件并显示。
-            # 以下代码只是一个示例，你需要根据实际情况修改。
             self.file_list.clear()  # 清空文件列表
-            for file_name in os.listdir(folder_path):
-                if file_name.startswith('processed_'):  # 假设处理后的文件名以 "processed_" 开头
-                    self.file_list.addItem(file_name)
+            for file_name in sorted(os.listdir(folder_path)):
+                if file_name.lower().endswith(('.mp4', '.avi', '.mov')):  # 片段、拼接结果和各批处理的输出
+                    self.add_file_item(os.path.join(folder_path, file_name))
 
     def open_processed_file(self):
         """打开处理后的文件。"""
-        file_path, _ = QFileDialog.getOpenFileName(self, "选择处理后的文件")
+        file_path, _ = QFileDialog.getOpenFileName(self, "选择处理后的文件", filter="视频文件 (*.mp4 *.avi *.mov)")
         if file_path:
-            # 这里需要根据你的实际处理逻辑来显示处理后的文件
-            # 以下代码只是一个示例，你需要根据实际情况修改。
             self.file_list.clear()  # 清空文件列表
-            self.file_list.addItem(os.path.basename(file_path))  # 显示文件名
+            self.file_list.setCurrentItem(self.add_file_item(file_path))
+
+    def add_file_item(self, file_path):
+        """在文件列表中显示文件名，并保存完整路径。"""
+        item = QListWidgetItem(os.path.basename(file_path))
+        item.setData(Qt.UserRole, file_path)
+        self.file_list.addItem(item)
+        return item
+
+    def preview_selected_file(self, item, previous=None):
+        """在后台生成选中文件的预览。"""
+        if item is not None:
+            self.preview_worker.load(item.data(Qt.UserRole))
+
+    @pyqtSlot(float)
+    def set_preview_duration(self, duration):
+        """记录预览视频的时长，并把滑块移回开头。"""
+        self.preview_duration = duration
+        self.preview_slider.blockSignals(True)
+        self.preview_slider.setValue(0)
+        self.preview_slider.blockSignals(False)
+
+    def seek_preview(self, value):
+        """拖动滑块时请求对应位置的画面。"""
+        if self.preview_duration > 0:
+            self.preview_worker.seek(value / self.preview_slider.maximum() * self.preview_duration)
+
+    @pyqtSlot(object)
+    def show_preview_frame(self, frame):
+        """显示预览线程解码好的画面。"""
+        height, width = frame.shape[:2]
+        image = QImage(frame.data, width, height, 3 * width, QImage.Format_RGB888).copy()
+        self.preview_item.setPixmap(QPixmap.fromImage(image))
+        self.preview_view.fitInView(self.preview_item, Qt.KeepAspectRatio)
+
+    @pyqtSlot(str)
+    def show_thumbnails(self, strip_path):
+        """显示缩略图条。"""
+        self.thumbnail_label.setPixmap(QPixmap(strip_path))
+
+    def closeEvent(self, event):
+        """关闭窗口前结束预览线程和正在生成的代理文件，并取消队列中的作业（作业进程不会在界面关闭后继续运行）。"""
+        if self.preview_worker.isRunning():
+            self.preview_worker.stop()
+        if self.job_queue.scheduler.pending():
+            self.job_queue.scheduler.cancel()
+            self.job_queue.wait()
+        super().closeEvent(event)
 
     def select_clip_folder(self):
         """选择要剪辑的视频文件夹。"""
@@ -422,7 +672,7 @@ class MainWindow(QMainWindow):
             self.concat_output_folder = folder_path
 
     def toggle_video_processing(self):
-        """开始或暂停视频处理。"""
+        """开始或停止视频处理。"""
         if self.video_processor.isRunning():
             self.video_processor.pause()
             self.process_video_button.setText("开始批处理视频")
@@ -437,33 +687,124 @@ class MainWindow(QMainWindow):
 
             if clip_folder:
                 # 启动视频剪辑处理线程
-                self.video_processor.set_parameters(clip_folder, clip_folder, 0, 'clip')  # 输出文件夹为源文件夹，拼接时间为0表示不拼接
-                self.video_processor._is_paused = False  # 重置暂停标志
+                segment_mode = 'scene' if self.scene_checkbox.isChecked() else 'random'
+                self.video_processor.set_parameters(clip_folder, clip_folder, 0, 'clip',
+                                                    self.frame_exact_checkbox.isChecked(),
+                                                    segment_mode=segment_mode)  # 输出文件夹为源文件夹，拼接时间为0表示不拼接
                 self.video_processor.start()
-                self.process_video_button.setText("暂停")
+                self.process_video_button.setText("停止")
             elif concat_time and output_folder:
                 try:
-                    # 将拼接时间转换为秒
-                    minutes, seconds = map(int, concat_time.split('-'))
-                    concat_time_in_seconds = minutes * 60 + seconds
+                    concat_time_in_seconds = parse_concat_time(concat_time)  # 将拼接时间转换为秒
                 except ValueError:
                     self.log_message("拼接时间格式无效，应为 '分钟-秒'。")  # 添加调试信息
                     return
 
-                # 启动视频拼接处理线程
-                self.video_processor.set_parameters(output_folder, output_folder, concat_time_in_seconds, 'concat')
-                self.video_processor._is_paused = False  # 重置暂停标志
+                # 启动视频拼接处理线程，同时给出片头时拼接和片头合并为一次编码
+                transition_duration = self.TRANSITION_DURATION if self.transition_checkbox.isChecked() else 0
+                profile = self.profile_combobox.currentData()
+                self.video_processor.set_parameters(output_folder, output_folder, concat_time_in_seconds,
+                                                    'render' if header_file else 'concat',
+                                                    transition_duration=transition_duration,
+                                                    profiles={'concat': profile}, header_file=header_file)
                 self.video_processor.start()
-                self.process_video_button.setText("暂停")
+                self.process_video_button.setText("停止")
             elif header_file and output_folder:
                 # 启动片头拼接处理线程
-                self.video_header_processor.set_parameters(header_file, output_folder)
-                self.video_header_processor._is_paused = False  # 重置暂停标志
+                self.video_header_processor.set_parameters(header_file, output_folder,
+                                                           profiles={'header': self.profile_combobox.currentData()})
                 self.video_header_processor.start()
-                self.process_video_button.setText("暂停")
+                self.process_video_button.setText("停止")
             else:
                 self.log_message("请确保已选择文件夹或输入拼接时间和片头文件。")  # 添加调试信息
 
+    def select_audio_video_folder(self):
+        """选择要添加背景音乐的视频文件夹。"""
+        folder_path = QFileDialog.getExistingDirectory(self, "选择要添加背景音乐的视频文件夹")
+        if folder_path:
+            self.audio_video_edit.setText(folder_path)
+
+    def select_bg_music_file(self):
+        """选择背景音乐文件。"""
+        file_path, _ = QFileDialog.getOpenFileName(self, "选择背景音乐文件", filter="音频文件 (*.mp3 *.wav *.m4a *.aac *.flac)")
+        if file_path:
+            self.bg_music_edit.setText(file_path)
+
+    def select_subtitle_audio_file(self):
+        """选择字幕配音文件。"""
+        file_path, _ = QFileDialog.getOpenFileName(self, "选择字幕配音文件", filter="音频文件 (*.mp3 *.wav *.m4a *.aac *.flac)")
+        if file_path:
+            self.subtitle_audio_edit.setText(file_path)
+
+    def toggle_audio_processing(self):
+        """开始或停止背景音乐处理。"""
+        if self.audio_processor.isRunning():
+            self.audio_processor.pause()
+            self.process_audio_button.setText("开始批处理音乐")
+            return
+
+        video_folder = self.audio_video_edit.text()
+        music_file = self.bg_music_edit.text()
+        voice_file = self.subtitle_audio_edit.text()
+        if not video_folder or not (music_file or voice_file):
+            self.log_message("请选择视频文件夹和背景音乐或配音文件。")  # 添加调试信息
+            return
+        self.audio_processor.set_parameters(video_folder, music_file, voice_file,
+                                            self.music_volume_spinbox.value() / 100)
+        self.audio_processor.start()
+        self.process_audio_button.setText("停止")
+
+    def select_subtitle_video_folder(self):
+        """选择要烧录字幕的视频文件夹，字幕文件与视频同名（.srt 或 .ass）。"""
+        folder_path = QFileDialog.getExistingDirectory(self, "选择要烧录字幕的视频文件夹")
+        if folder_path:
+            self.subtitle_video_edit.setText(folder_path)
+
+    def toggle_subtitle_processing(self):
+        """开始或停止字幕处理。"""
+        if self.subtitle_processor.isRunning():
+            self.subtitle_processor.pause()
+            self.process_subtitle_button.setText("开始批处理字幕")
+            return
+
+        video_folder = self.subtitle_video_edit.text()
+        if not video_folder:
+            self.log_message("请选择要烧录字幕的视频文件夹。")  # 添加调试信息
+            return
+        try:
+            renderer = SubtitleRenderer(self.font_combobox.currentData(), self.font_size_spinbox.value(),
+                                        self.font_style_combobox.currentText())
+        except ValueError as e:
+            self.log_message(f"无法使用字体: {e}")  # 添加调试信息
+            return
+        self.subtitle_processor.set_parameters(video_folder, renderer,
+                                               profiles={'subtitle': self.profile_combobox.currentData()})
+        self.subtitle_processor.start()
+        self.process_subtitle_button.setText("停止")
+
+    def toggle_watermark_processing(self):
+        """开始或停止水印处理。"""
+        if self.watermark_processor.isRunning():
+            self.watermark_processor.pause()
+            self.process_watermark_button.setText("开始批处理水印")
+            return
+
+        video_folder = self.watermark_video_edit.text()
+        image_file = self.watermark_image_edit.text()
+        if not video_folder or not image_file:
+            self.log_message("请选择要添加水印的视频文件夹和水印图片。")  # 添加调试信息
+            return
+        try:
+            watermark = Watermark(image_file, self.watermark_position_edit.text(), self.watermark_size_edit.text(),
+                                  os.path.join(video_folder, CACHE_FOLDER_NAME))
+        except ValueError:
+            self.log_message("水印位置或大小格式无效。")  # 添加调试信息
+            return
+        self.watermark_processor.set_parameters(video_folder, watermark,
+                                                profiles={'watermark': self.profile_combobox.currentData()})
+        self.watermark_processor.start()
+        self.process_watermark_button.setText("停止")
+
     def select_watermark_video_file(self):
         """选择要添加水印的视频文件夹。"""
         folder_path = QFileDialog.getExistingDirectory(self, "选择要添加水印的视频文件夹")
@@ -478,11 +819,105 @@ class MainWindow(QMainWindow):
             self.watermark_image_edit.setText(file_path)
 
 
+    def enqueue_jobs(self):
+        """按界面上填写的剪辑、拼接、片头、音乐、字幕和水印参数生成作业并加入队列。"""
+        profile = self.profile_combobox.currentData()
+        jobs = []
+        clip_folder = self.clip_file_edit.text()
+        header_file = self.add_header_edit.text()
+        concat_time = self.concat_time_edit.text()
+        output_folder = getattr(self, 'concat_output_folder', None)
+        if clip_folder:
+            jobs.append({'source': clip_folder, 'output': clip_folder, 'operations': ['clip'],
+                         'frame_exact': self.frame_exact_checkbox.isChecked(),
+                         'segment_mode': 'scene' if self.scene_checkbox.isChecked() else 'random'})
+        if concat_time and output_folder:
+            try:
+                concat_time_in_seconds = parse_concat_time(concat_time)  # 将拼接时间转换为秒
+            except ValueError:
+                self.log_message("拼接时间格式无效，应为 '分钟-秒'。")  # 添加调试信息
+                return
+            jobs.append({'output': output_folder, 'operations': ['concat', 'header'] if header_file else ['concat'],
+                         'concat_time': concat_time_in_seconds, 'header': header_file,
+                         'transition': self.TRANSITION_DURATION if self.transition_checkbox.isChecked() else 0,
+                         'profiles': {'concat': profile, 'header': profile}})
+        elif header_file and output_folder:
+            jobs.append({'output': output_folder, 'operations': ['header'], 'header': header_file,
+                         'profiles': {'header': profile}})
+        if self.audio_video_edit.text() and (self.bg_music_edit.text() or self.subtitle_audio_edit.text()):
+            jobs.append({'output': self.audio_video_edit.text(), 'operations': ['audio'], 'prefix': '',
+                         'music': self.bg_music_edit.text(), 'voice': self.subtitle_audio_edit.text(),
+                         'music_volume': self.music_volume_spinbox.value() / 100})
+        if self.subtitle_video_edit.text():
+            jobs.append({'output': self.subtitle_video_edit.text(), 'operations': ['subtitle'], 'prefix': '',
+                         'subtitle_font': self.font_combobox.currentData(),
+                         'subtitle_size': self.font_size_spinbox.value(),
+                         'subtitle_style': self.font_style_combobox.currentText(), 'profiles': {'subtitle': profile}})
+        if self.watermark_video_edit.text() and self.watermark_image_edit.text():
+            jobs.append({'output': self.watermark_video_edit.text(), 'operations': ['watermark'], 'prefix': '',
+                         'watermark': self.watermark_image_edit.text(),
+                         'watermark_position': self.watermark_position_edit.text() or '右下',
+                         'watermark_size': self.watermark_size_edit.text() or '15%',
+                         'profiles': {'watermark': profile}})
+        if not jobs:
+            self.log_message("请先填写要处理的文件夹和参数。")  # 添加调试信息
+            return
+        for job in jobs:
+            job['name'] = f"{'+'.join(job['operations'])}:{os.path.basename(job['output'])}"
+            self.job_queue.submit(job, self.priority_spinbox.value())
+
+    def toggle_queue_paused(self):
+        """暂停或继续队列中的全部作业，正在进行的编码会立即停下。"""
+        if self.pause_queue_button.text() == "暂停队列":
+            self.job_queue.scheduler.pause()
+            self.pause_queue_button.setText("继续队列")
+        else:
+            self.job_queue.scheduler.resume()
+            self.pause_queue_button.setText("暂停队列")
+
+    def cancel_jobs(self):
+        """取消选中的作业，没有选中时取消全部作业。"""
+        item = self.job_list.currentItem()
+        self.job_queue.scheduler.cancel(item.data(Qt.UserRole) if item is not None else None)
+
+    def job_item(self, name):
+        """返回作业列表中作业对应的项，没有时新建。"""
+        for i in range(self.job_list.count()):
+            if self.job_list.item(i).data(Qt.UserRole) == name:
+                return self.job_list.item(i)
+        item = QListWidgetItem(name)
+        item.setData(Qt.UserRole, name)
+        self.job_list.addItem(item)
+        return item
+
+    @pyqtSlot(str, str)
+    def update_job_status(self, name, state):
+        """在作业列表中显示作业状态，运行中和暂停的作业同时显示进度。"""
+        item = self.job_item(name)
+        item.setData(Qt.UserRole + 1, state)
+        progress = f"  {self.job_progress[name]}%" if state in ('running', 'paused') and name in self.job_progress else ''
+        item.setText(f"{name}  {JOB_STATES[state]}{progress}")
+
+    @pyqtSlot(str, int)
+    def update_job_progress(self, name, value):
+        """更新作业的进度，进度条显示最近更新的作业进度。"""
+        self.job_progress[name] = value
+        self.progress_bar.setValue(value)
+        self.update_job_status(name, self.job_item(name).data(Qt.UserRole + 1))
+
     @pyqtSlot(int)
     def update_progress(self, value):
         """更新进度条。"""
         self.progress_bar.setValue(value)
 
+    @pyqtSlot(object)
+    def handle_event(self, event):
+        """根据结构化事件在进度条上显示剩余时间。"""
+        if event['event'] == 'progress' and event['eta'] is not None:
+            self.progress_bar.setFormat(f"%p%  剩余 {int(event['eta'])} 秒")
+        elif event['event'] in ('stage_start', 'stage_end'):
+            self.progress_bar.setFormat("%p%")
+
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
@@ -0,0 +1,278 @@
+"""剪辑、拼接和片头拼接的性能基准测试。
+
+用 ffmpeg 的 testsrc2 测试源在本地生成合成视频（无需联网），按不同模式（重新编码/流复制、
+串行/并行）运行各处理阶段，输出墙钟时间、实时倍率、本进程和子进程（ffmpeg 等）的峰值内存，
+以及包括子进程在内打开的文件句柄数，结果为 JSON，可以与之前的结果对比。
+
+用法::
+
+    python vedit_bench.py --output bench.json
+    python vedit_bench.py --quick --compare bench.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+
+from vedit_core import FFMPEG_BINARY, VideoEngine, run_ffmpeg
+
+# 数据集：分辨率、单个视频时长（秒）、视频个数
+DATASETS = {
+    'small': {'size': '640x360', 'duration': 20, 'count': 4},
+    'hd': {'size': '1280x720', 'duration': 60, 'count': 4},
+    'full_hd': {'size': '1920x1080', 'duration': 120, 'count': 2},
+}
+QUICK_DATASETS = ('small',)
+
+# 测试用例：阶段和模式
+CASES = [
+    {'stage': 'clip', 'mode': 'keyframe', 'workers': 1},
+    {'stage': 'clip', 'mode': 'keyframe', 'workers': 0},
+    {'stage': 'clip', 'mode': 'exact', 'workers': 1},
+    {'stage': 'clip', 'mode': 'exact', 'workers': 0},
+    {'stage': 'concat', 'mode': 'copy', 'workers': 0},
+    {'stage': 'concat', 'mode': 'transition', 'workers': 0},
+    {'stage': 'header', 'mode': 'copy', 'workers': 1},
+    {'stage': 'header', 'mode': 'copy', 'workers': 0},
+]
+
+
+def make_video(path, size, duration, rate=30):
+    """用 testsrc2 和正弦波生成带音轨的合成视频，已存在时跳过。"""
+    if os.path.exists(path):
+        return
+    run_ffmpeg(['-f', 'lavfi', '-i', f"testsrc2=size={size}:rate={rate}:duration={duration}",
+                '-f', 'lavfi', '-i', f"sine=frequency=440:sample_rate=44100:duration={duration}",
+                '-c:v', 'libx264', '-preset', 'veryfast', '-g', str(rate * 2), '-pix_fmt', 'yuv420p',
+                '-c:a', 'aac', '-shortest', path])
+
+
+def prepare_dataset(workdir, name):
+    """生成数据集的源视频、剪辑好的片段、final_* 视频和片头，返回各目录路径。"""
+    spec = DATASETS[name]
+    root = os.path.join(workdir, name)
+    paths = {folder: os.path.join(root, folder) for folder in ('source', 'segments', 'finals')}
+    for folder in paths.values():
+        os.makedirs(folder, exist_ok=True)
+
+    for i in range(spec['count']):
+        make_video(os.path.join(paths['source'], f"src{i}.mp4"), spec['size'], spec['duration'])
+        final_path = os.path.join(paths['finals'], f"final_{i}.mp4")
+        if not os.path.exists(final_path):
+            shutil.copyfile(os.path.join(paths['source'], f"src{i}.mp4"), final_path)
+    paths['header'] = os.path.join(root, 'header.mp4')
+    make_video(paths['header'], '1280x720', 3, rate=25)  # 片头参数故意与目标不同，需要预转码
+
+    if not any(file_name.endswith('.mp4') for file_name in os.listdir(paths['segments'])):
+        VideoEngine(log=lambda message: None, seed=1).clip_videos(paths['source'], paths['segments'])
+    return paths
+
+
+def reset_outputs(folder):
+    """删除上一次运行留下的输出、索引、日志和缓存，保证每次都是冷启动。"""
+    for file_name in os.listdir(folder):
+        path = os.path.join(folder, file_name)
+        if file_name.startswith(('final_final_', 'final_output', '.vedit_')):
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+
+class ProcessTreeSampler(threading.Thread):
+    """后台线程，定期统计本进程及其子孙进程（剪辑工作进程、ffmpeg）打开的文件句柄数和子孙进程的内存合计，记录峰值。
+
+    通过 /proc 采样，只在 Linux 上有效；在两次采样之间启动又退出的进程不会被计入。
+    """
+
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+        self.peak_fds = 0
+        self.peak_children_rss = 0  # 字节
+        self._stop_event = threading.Event()
+        self.sample()
+
+    @staticmethod
+    def descendants(root):
+        """返回 root 的全部子孙进程号。"""
+        children = {}
+        try:
+            names = os.listdir('/proc')
+        except OSError:
+            return []
+        for name in names:
+            if not name.isdigit():
+                continue
+            try:
+                with open(f"/proc/{name}/stat", encoding='ascii', errors='replace') as f:
+                    ppid = int(f.read().rpartition(')')[2].split()[1])  # 进程名可能包含空格和括号
+            except (OSError, ValueError, IndexError):
+                continue  # 进程已经退出
+            children.setdefault(ppid, []).append(int(name))
+        result = []
+        stack = [root]
+        while stack:
+            for pid in children.get(stack.pop(), []):
+                result.append(pid)
+                stack.append(pid)
+        return result
+
+    @staticmethod
+    def count_fds(pid):
+        try:
+            return len(os.listdir(f"/proc/{pid}/fd"))
+        except OSError:
+            return 0
+
+    def rss(self, pid):
+        try:
+            with open(f"/proc/{pid}/statm", encoding='ascii') as f:
+                return int(f.read().split()[1]) * self.page_size
+        except (OSError, ValueError, IndexError):
+            return 0
+
+    def sample(self):
+        """采样一次并更新峰值。"""
+        pids = self.descendants(os.getpid())
+        self.peak_fds = max(self.peak_fds, self.count_fds(os.getpid()) + sum(self.count_fds(pid) for pid in pids))
+        self.peak_children_rss = max(self.peak_children_rss, sum(self.rss(pid) for pid in pids))
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def run_case(case, paths, spec):
+    """在当前进程中运行一个用例，返回测量结果。"""
+    import resource
+
+    engine = VideoEngine(log=lambda message: None, seed=1, workers=case['workers'],
+                         frame_exact=case['mode'] == 'exact',
+                         transition_duration=0.5 if case['mode'] == 'transition' else 0)
+    if case['stage'] == 'clip':
+        output = tempfile.mkdtemp(dir=os.path.dirname(paths['source']))
+        media_seconds = spec['duration'] * spec['count']
+        action = lambda: engine.clip_videos(paths['source'], output)
+    elif case['stage'] == 'concat':
+        output = paths['segments']
+        media_seconds = spec['duration'] * spec['count'] / 2
+        action = lambda: engine.concat_videos(output, media_seconds)
+    else:
+        output = paths['finals']
+        media_seconds = (spec['duration'] + 3) * spec['count']
+        action = lambda: engine.concat_header(paths['header'], output)
+    reset_outputs(output)
+
+    sampler = ProcessTreeSampler()
+    sampler.start()
+    start = time.perf_counter()
+    action()
+    wall_time = time.perf_counter() - start
+    sampler.stop()
+
+    if case['stage'] == 'clip':
+        shutil.rmtree(output)
+    # Linux 上 ru_maxrss 的单位是 KB
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        'wall_time': round(wall_time, 3),
+        'realtime_factor': round(media_seconds / wall_time, 2) if wall_time > 0 else None,
+        'peak_rss_mb': round(self_rss / 1024, 1),
+        'peak_child_rss_mb': round(sampler.peak_children_rss / 1024 / 1024, 1),  # 同一时刻全部子孙进程的合计
+        'peak_open_fds': sampler.peak_fds,  # 本进程和子孙进程合计
+    }
+
+
+def case_name(dataset, case):
+    return f"{dataset}/{case['stage']}/{case['mode']}/{'serial' if case['workers'] == 1 else 'parallel'}"
+
+
+def run_suite(workdir, datasets, repeat):
+    """逐个用例在独立子进程中运行（峰值内存互不影响），返回结果字典。"""
+    results = {}
+    for dataset in datasets:
+        print(f"准备数据集: {dataset}", file=sys.stderr)
+        prepare_dataset(workdir, dataset)
+        for case in CASES:
+            name = case_name(dataset, case)
+            runs = []
+            for _ in range(repeat):
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-case',
+                                         json.dumps({'workdir': workdir, 'dataset': dataset, 'case': case})],
+                                        stdout=subprocess.PIPE, check=True)
+                runs.append(json.loads(output.stdout.decode('utf-8').strip().splitlines()[-1]))
+            best = min(runs, key=lambda run: run['wall_time'])
+            best['runs'] = [run['wall_time'] for run in runs]
+            results[name] = best
+            print(f"{name}: {best['wall_time']}s, 实时倍率 {best['realtime_factor']}x", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline):
+    """打印与基线结果的对比（墙钟时间比例，小于 1 表示变快）。"""
+    for name, result in sorted(results.items()):
+        old = baseline.get('results', {}).get(name)
+        if old is None:
+            print(f"{name}: 新用例")
+            continue
+        ratio = result['wall_time'] / old['wall_time'] if old['wall_time'] else float('inf')
+        print(f"{name}: {old['wall_time']}s -> {result['wall_time']}s ({ratio:.2f}x), "
+              f"内存 {old['peak_rss_mb']} -> {result['peak_rss_mb']} MB, "
+              f"子进程内存 {old.get('peak_child_rss_mb')} -> {result['peak_child_rss_mb']} MB, "
+              f"句柄 {old['peak_open_fds']} -> {result['peak_open_fds']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="视频处理性能基准测试")
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'vedit_bench'),
+                        help="存放合成视频的目录，重复运行时复用")
+    parser.add_argument('--datasets', nargs='+', choices=sorted(DATASETS), help="要运行的数据集")
+    parser.add_argument('--quick', action='store_true', help="只运行最小的数据集")
+    parser.add_argument('--repeat', type=int, default=1, help="每个用例运行的次数，取最快的一次")
+    parser.add_argument('--output', help="把结果写入 JSON 文件")
+    parser.add_argument('--compare', help="与之前的 JSON 结果对比")
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        params = json.loads(args.run_case)
+        dataset = params['dataset']
+        paths = prepare_dataset(params['workdir'], dataset)
+        print(json.dumps(run_case(params['case'], paths, DATASETS[dataset])))
+        return 0
+
+    if shutil.which(FFMPEG_BINARY) is None:
+        parser.error(f"找不到 ffmpeg: {FFMPEG_BINARY}")
+    datasets = args.datasets or (QUICK_DATASETS if args.quick else sorted(DATASETS))
+    os.makedirs(args.workdir, exist_ok=True)
+    results = run_suite(args.workdir, datasets, max(1, args.repeat))
+    report = {
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""命令行入口：不启动界面、不导入 PyQt5，按任务清单批量执行剪辑、拼接和片头拼接。
+
+任务清单为 JSON 文件，例如::
+
+    {"jobs": [{"name": "a", "source": "/data/a", "output": "/data/a_out",
+               "operations": ["clip", "concat", "header"],
+               "concat_time": "10-00", "header": "/data/header.mp4", "priority": 1}]}
+
+priority 越大的作业越先执行；按 Ctrl+C 取消所有作业并删除未完成的临时文件。
+"""
+import sys
+import json
+import argparse
+
+from vedit_core import run_jobs
+
+
+def load_manifest(path):
+    """读取任务清单，支持 {"jobs": [...]} 或直接的作业列表。"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    jobs = data.get('jobs', []) if isinstance(data, dict) else data
+    if not isinstance(jobs, list):
+        raise ValueError("任务清单中的 jobs 必须是列表")
+    return jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="视频批处理命令行（剪辑/拼接/片头拼接）")
+    parser.add_argument('manifest', help="任务清单 JSON 文件")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="同时运行的作业数（默认 1）")
+    parser.add_argument('--cpu-budget', type=int, default=0,
+                        help="同时运行的作业合计占用的核数（默认为 CPU 核数），作业按 priority 字段排队")
+    args = parser.parse_args(argv)
+
+    try:
+        jobs = load_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        parser.error(f"无法读取任务清单: {e}")
+    try:
+        failed = run_jobs(jobs, max(1, args.jobs), cpu_budget=max(0, args.cpu_budget))
+    except KeyboardInterrupt:
+        return 130
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
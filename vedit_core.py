@@ -0,0 +1,2781 @@
+"""视频处理核心：剪辑、拼接和片头拼接，不依赖 Qt，可供界面和命令行共同使用。"""
+import os
+import re
+import csv
+import json
+import time
+import heapq
+import queue
+import signal
+import bisect
+import hashlib
+import threading
+import random
+import subprocess
+import multiprocessing
+import multiprocessing.connection
+import numpy as np
+from fractions import Fraction
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, CancelledError, FIRST_COMPLETED, wait, as_completed
+
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+FFPROBE_BINARY = os.environ.get('FFPROBE_BINARY', 'ffprobe')
+CACHE_FOLDER_NAME = '.vedit_cache'  # 输出文件夹中存放可复用中间文件（如转码后的片头）的目录
+AUDIO_SAMPLE_RATE = 44100  # 背景音乐混音使用的采样率，统一为双声道 float32
+SCENE_ANALYSIS_SIZE = (64, 36)  # 镜头切换分析时把画面缩小到的尺寸（灰度）
+SCENE_THRESHOLD = 0.12  # 镜头切换分数（0~1）达到该值时视为镜头切换
+SCENE_KEYFRAME_TOLERANCE = 0.1  # 按关键帧切分时，镜头切换与关键帧相差不超过该值（秒）才可作为切点
+SEGMENT_NAME_PATTERN = re.compile(r'^\d+s_.+_(\d+)s~(\d+)s\.mp4$')  # segment_name 生成的文件名，记录片段起止秒数
+KEYFRAME_SEGMENT_RANGE = (2, 8)  # 3~5 秒内没有关键帧时，对齐到最近关键帧后可接受的片段时长范围（秒）
+SEGMENT_MODES = ('random', 'scene')  # 片段切分方式：随机 3~5 秒，或优先在镜头切换处切分
+# 一次渲染时随机选用的 ffmpeg xfade 转场
+XFADE_TRANSITIONS = ('fade', 'dissolve', 'wipeleft', 'wiperight', 'slideleft', 'slideright', 'circleopen', 'circleclose')
+
+# 片头预转码时，目标视频编码对应的 ffmpeg 编码器
+VIDEO_ENCODERS = {'h264': 'libx264', 'hevc': 'libx265', 'mpeg4': 'mpeg4', 'vp9': 'libvpx-vp9'}
+AUDIO_ENCODERS = {'aac': 'aac', 'mp3': 'libmp3lame', 'opus': 'libopus'}
+# ffprobe 报告的 H.264/HEVC profile 对应的编码器 -profile:v 参数
+ENCODER_PROFILE_NAMES = {
+    'libx264': {'Constrained Baseline': 'baseline', 'Baseline': 'baseline', 'Main': 'main', 'High': 'high',
+                'High 10': 'high10', 'High 4:2:2': 'high422', 'High 4:4:4 Predictive': 'high444'},
+    'libx265': {'Main': 'main', 'Main 10': 'main10', 'Main Still Picture': 'mainstillpicture'},
+}
+
+# 编码档位：draft 用于草稿输出，proxy（低分辨率、全帧内）用于预览代理文件，
+# intermediate 和 lossless（全帧内、无损）用于中间片段，delivery 用于成片
+ENCODER_PROFILES = {
+    'draft': {'codec': 'libx264', 'preset': 'ultrafast', 'crf': 32, 'height': 360, 'audio_bitrate': '64k'},
+    'intermediate': {'codec': 'libx264', 'preset': 'fast', 'crf': 18, 'audio_bitrate': '192k'},
+    'lossless': {'codec': 'libx264', 'preset': 'ultrafast', 'crf': 0, 'intra': True, 'audio_bitrate': '320k'},
+    'delivery': {'codec': 'libx264', 'preset': 'slow', 'crf': 18, 'audio_bitrate': '192k'},
+    'proxy': {'codec': 'libx264', 'preset': 'ultrafast', 'crf': 28, 'height': 360, 'intra': True, 'audio_bitrate': '64k'},
+}
+# 各处理阶段默认使用的编码档位
+DEFAULT_STAGE_PROFILES = {'clip': 'intermediate', 'concat': 'delivery', 'header': 'delivery', 'watermark': 'delivery',
+                          'subtitle': 'delivery'}
+
+# 字幕样式：文字颜色、描边颜色和背景框颜色（RGBA）
+SUBTITLE_STYLES = {
+    '白字黑边': {'fill': (255, 255, 255, 255), 'stroke': (0, 0, 0, 255), 'box': None},
+    '黄字黑边': {'fill': (255, 220, 0, 255), 'stroke': (0, 0, 0, 255), 'box': None},
+    '白字黑底': {'fill': (255, 255, 255, 255), 'stroke': None, 'box': (0, 0, 0, 160)},
+}
+# 查找系统字体的目录
+FONT_FOLDERS = ['/usr/share/fonts', '/usr/local/share/fonts', os.path.expanduser('~/.fonts'),
+                os.path.expanduser('~/.local/share/fonts'), '/Library/Fonts', '/System/Library/Fonts',
+                os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts')]
+
+# 水印位置名称对应的水平、垂直位置比例（0 为左/上，1 为右/下）
+WATERMARK_POSITIONS = {'左上': (0, 0), '右上': (1, 0), '左下': (0, 1), '右下': (1, 1), '居中': (0.5, 0.5)}
+
+
+def load_moviepy():
+    """按需导入 moviepy：导入很慢，只在需要重新编码时才加载。"""
+    import moviepy.editor as mpe
+    return mpe
+
+
+def run_ffmpeg(args, on_frames=None, on_start=None):
+    """执行 ffmpeg 命令，失败时抛出 RuntimeError。
+
+    给出 on_frames 时通过 -progress 读取编码进度，每次以新处理的帧数调用 on_frames；
+    给出 on_start 时在 ffmpeg 启动后以进程对象调用 on_start，调用方可以借此提前结束 ffmpeg。
+    """
+    cmd = [FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-y']
+    if on_frames is not None:
+        cmd += ['-progress', 'pipe:1', '-nostats']
+    cmd += list(args)
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE if on_frames is not None else subprocess.DEVNULL,
+                               stderr=subprocess.PIPE)
+    stderr_tail = drain_stderr(process)
+    if on_start is not None:
+        on_start(process)
+    if on_frames is not None:
+        last_frame = 0
+        for line in process.stdout:
+            key, _, value = line.decode('ascii', 'replace').strip().partition('=')
+            if key == 'frame' and value.isdigit() and int(value) > last_frame:
+                on_frames(int(value) - last_frame)
+                last_frame = int(value)
+        process.stdout.close()
+    process.wait()
+    error = stderr_tail()
+    if process.returncode != 0:
+        raise RuntimeError(error)
+
+
+def drain_stderr(process, max_lines=20):
+    """在后台线程中读完子进程的 stderr，只保留最后 max_lines 行，返回等待读完并取得这些行的函数。
+
+    损坏的源文件会产生大量解码错误，stderr 不及时读取时管道写满，ffmpeg 会一直阻塞。
+    """
+    lines = deque(maxlen=max_lines)
+    thread = threading.Thread(target=lines.extend, args=(process.stderr,), daemon=True)
+    thread.start()
+
+    def tail():
+        thread.join()
+        process.stderr.close()
+        return b''.join(lines).decode('utf-8', 'replace').strip()
+
+    return tail
+
+
+def frame_logger(on_frames):
+    """返回 moviepy 的 proglog 日志器，把 write_videofile 每写出的帧数交给 on_frames。"""
+    import proglog
+
+    class FrameLogger(proglog.ProgressBarLogger):
+        def __init__(self):
+            super().__init__()
+            self.last_index = -1
+
+        def bars_callback(self, bar, attr, value, old_value=None):
+            if bar == 't' and attr == 'index' and value > self.last_index:
+                on_frames(value - self.last_index)
+                self.last_index = value
+
+    return FrameLogger()
+
+
+class Instrumentation:
+    """结构化的处理事件记录。
+
+    按阶段和文件记录耗时、帧数、每秒处理帧数、写出字节数和任务队列深度，事件以 JSON lines
+    追加到日志文件并交给回调（界面通过 Qt 信号接收）；进度和剩余时间按已处理帧数计算。
+    """
+    PROGRESS_INTERVAL = 0.5  # 进度事件的最小间隔（秒）
+
+    def __init__(self, callback=None, log_path=None):
+        self.callback = callback
+        self.log_path = log_path
+        self.stage_name = ''
+        self.total_frames = 0
+        self.done_frames = 0
+        self.bytes_written = 0
+        self.queue_depth = 0
+        self._stage_start = 0
+        self._last_progress = 0
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        """发出一条事件：写入 JSON lines 日志并调用回调。"""
+        record = {'time': round(time.time(), 3), 'event': event, 'stage': self.stage_name}
+        record.update(fields)
+        with self._lock:
+            if self.log_path:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        if self.callback:
+            self.callback(record)
+        return record
+
+    @contextmanager
+    def stage(self, name, total_frames=0, log_path=None):
+        """记录一个处理阶段的开始和结束，阶段内的帧数和字节数从零开始累计。"""
+        self.stage_name = name
+        self.log_path = log_path or self.log_path
+        self.total_frames = total_frames
+        self.done_frames = 0
+        self.bytes_written = 0
+        self.queue_depth = 0
+        self._stage_start = self._last_progress = time.perf_counter()
+        self.emit('stage_start', total_frames=int(total_frames))
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - self._stage_start
+            self.emit('stage_end', elapsed=round(elapsed, 3), frames=int(self.done_frames),
+                      fps=round(self.done_frames / elapsed, 1) if elapsed > 0 else None,
+                      bytes=self.bytes_written)
+
+    def file_done(self, path, elapsed, frames, bytes_written=0):
+        """记录一个文件的处理结果。"""
+        self.bytes_written += bytes_written
+        self.emit('file', file=os.path.basename(path), elapsed=round(elapsed, 3), frames=int(frames),
+                  fps=round(frames / elapsed, 1) if elapsed > 0 else None, bytes=bytes_written)
+
+    def add_frames(self, frames):
+        """累计已处理帧数，返回 (进度百分比, 预计剩余秒数)；按间隔发出 progress 事件。"""
+        with self._lock:
+            self.done_frames += frames
+            done = min(self.done_frames, self.total_frames) if self.total_frames else self.done_frames
+        percent, eta = self.progress()
+        now = time.perf_counter()
+        if now - self._last_progress >= self.PROGRESS_INTERVAL:
+            self._last_progress = now
+            self.emit('progress', frames=int(done), total_frames=int(self.total_frames), percent=percent,
+                      eta=eta, queue_depth=self.queue_depth)
+        return percent, eta
+
+    def progress(self):
+        """按已处理帧数计算进度百分比和预计剩余秒数。"""
+        if not self.total_frames:
+            return 0, None
+        done = min(self.done_frames, self.total_frames)
+        elapsed = time.perf_counter() - self._stage_start
+        eta = round((self.total_frames - done) * elapsed / done, 1) if done else None
+        return int(done / self.total_frames * 100), eta
+
+
+def run_ffprobe(args):
+    """执行 ffprobe 命令并返回标准输出文本，失败时抛出 RuntimeError。"""
+    cmd = [FFPROBE_BINARY, '-v', 'error'] + list(args)
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode('utf-8', 'replace').strip())
+    return result.stdout.decode('utf-8', 'replace')
+
+
+def parse_rate(rate):
+    """把 ffprobe 的帧率字符串（如 '30000/1001'）转换为浮点数。"""
+    num, _, den = (rate or '0/1').partition('/')
+    try:
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def probe_media(video_path):
+    """读取视频的时长、帧率、分辨率和编码信息，只解析容器头，不解码画面。"""
+    output = run_ffprobe(['-show_entries',
+                          'format=duration:stream=codec_type,codec_name,width,height,avg_frame_rate,'
+                          'r_frame_rate,pix_fmt,time_base,profile,level,sample_rate,channels',
+                          '-of', 'json', video_path])
+    info = json.loads(output)
+    streams = info.get('streams', [])
+    video = next((st for st in streams if st.get('codec_type') == 'video'), None)
+    audio = next((st for st in streams if st.get('codec_type') == 'audio'), None)
+    if video is None:
+        raise RuntimeError("文件中没有视频流")
+
+    return {
+        'duration': float(info.get('format', {}).get('duration', 0) or 0),
+        'fps': parse_rate(video.get('avg_frame_rate')) or parse_rate(video.get('r_frame_rate')),
+        'width': video.get('width', 0),
+        'height': video.get('height', 0),
+        'codec': video.get('codec_name', ''),
+        'profile': video.get('profile', ''),
+        'level': video.get('level'),
+        'pix_fmt': video.get('pix_fmt', ''),
+        'time_base': video.get('time_base', ''),
+        'audio_codec': audio.get('codec_name') if audio else None,
+        'sample_rate': int(audio.get('sample_rate', 0)) if audio else None,
+        'channels': audio.get('channels') if audio else None,
+    }
+
+
+def probe_keyframes(video_path):
+    """读取视频流中所有关键帧的时间（秒），只扫描数据包，不解码画面。"""
+    output = run_ffprobe(['-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags',
+                          '-of', 'compact=p=0', video_path])
+
+    keyframes = []
+    for line in output.splitlines():
+        fields = dict(item.split('=', 1) for item in line.split('|') if '=' in item)
+        if 'K' in fields.get('flags', '') and fields.get('pts_time', 'N/A') != 'N/A':
+            keyframes.append(float(fields['pts_time']))
+    keyframes.sort()
+    if keyframes:
+        offset = keyframes[0]  # 以第一个关键帧为 0 点，与 ffmpeg 输出的时间戳一致
+        keyframes = [t - offset for t in keyframes]
+    return keyframes
+
+
+def scene_cut_candidates(scene_cuts, keyframes, start_time, duration):
+    """返回 start_time 之后 3~5 秒内可作为切点的镜头切换时间；给出关键帧时返回与镜头切换重合的关键帧。"""
+    lo = bisect.bisect_left(scene_cuts, start_time + 3)
+    hi = bisect.bisect_right(scene_cuts, start_time + 5)
+    candidates = [t for t in scene_cuts[lo:hi] if t < duration]
+    if not keyframes:
+        return candidates
+    snapped = []
+    for t in candidates:
+        j = bisect.bisect_left(keyframes, t)
+        snapped.extend(k for k in keyframes[max(j - 1, 0):j + 1]
+                       if abs(k - t) <= SCENE_KEYFRAME_TOLERANCE and start_time < k < duration)
+    return snapped
+
+
+def plan_segments(duration, keyframes=None, rng=random, scene_cuts=None):
+    """规划 3~5 秒的片段边界，给出关键帧时把切点对齐到附近的关键帧，片段时长不超过 KEYFRAME_SEGMENT_RANGE。
+
+    给出镜头切换时间 scene_cuts 时，优先在 3~5 秒范围内的镜头切换处切分，范围内没有镜头切换时按原方式切分。
+    """
+    segments = []
+    start_time = 0
+    while start_time < duration:
+        end_time = min(start_time + rng.randint(3, 5), duration)
+        candidates = scene_cut_candidates(scene_cuts, keyframes, start_time, duration) if scene_cuts else []
+        if candidates and end_time < duration:
+            end_time = min(candidates, key=lambda t: (abs(t - end_time), -t))  # 取最接近随机切点的镜头切换
+        elif keyframes and end_time < duration:
+            shortest, longest = KEYFRAME_SEGMENT_RANGE
+            lo = bisect.bisect_left(keyframes, start_time + shortest)
+            hi = bisect.bisect_right(keyframes, start_time + longest)
+            candidates = [t for t in keyframes[lo:hi] if t < duration]
+            window = [t for t in candidates if start_time + 3 <= t <= start_time + 5]
+            if window or candidates:
+                # 优先取 3~5 秒内最接近随机切点的关键帧
+                end_time = min(window or candidates, key=lambda t: (abs(t - end_time), -t))
+            # 附近没有关键帧（关键帧间隔过长）时保留随机切点，该片段由 split_segments 重新编码切出
+        segments.append((start_time, end_time))
+        start_time = end_time
+    return segments
+
+
+def segment_name(video_path, start_time, end_time):
+    """生成片段文件名，拼接步骤依赖这个格式查找片段。"""
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    return f"{int(end_time - start_time)}s_{base_name}_{int(start_time)}s~{int(end_time)}s.mp4"
+
+
+def segment_name_duration(file_name):
+    """从 segment_name 生成的文件名估计片段时长（整秒，误差不超过 1 秒），不是片段文件名时返回 None。"""
+    match = SEGMENT_NAME_PATTERN.search(file_name)
+    if match is None:
+        return None
+    return int(match.group(2)) - int(match.group(1))
+
+
+def choose_segments(segments, concat_time, transition_duration=0, rng=random, min_tail=1.0):
+    """从 [(片段路径, 时长), ...] 中随机选取片段，使总时长（扣除转场重叠）正好等于 concat_time。
+
+    片段池用完之前不会重复使用同一个片段；最后一个片段截短到恰好补足的长度，补足部分短于 min_tail 时
+    从前一个片段匀出一部分。返回 [(片段路径, 使用时长), ...]，使用时长不超过片段时长。
+    """
+    if not segments or concat_time <= 0:
+        return []
+    pool = []
+    selected = []
+    total_duration = 0
+    while True:
+        if not pool:
+            pool = list(segments)
+            rng.shuffle(pool)
+            if selected and len(pool) > 1 and pool[0][0] == selected[-1][0]:
+                pool.append(pool.pop(0))  # 重新洗牌后避免同一片段首尾相接
+        clip_path, duration = pool.pop(0)
+        overlap = transition_duration if selected else 0  # 转场会让相邻片段重叠
+        needed = concat_time - total_duration + overlap
+        if duration >= needed:
+            selected.append((clip_path, needed))
+            break
+        selected.append((clip_path, duration))
+        total_duration += duration - overlap
+
+    minimum = min_tail + transition_duration
+    if len(selected) > 1 and selected[-1][1] < minimum:
+        shift = minimum - selected[-1][1]
+        previous_path, previous_duration = selected[-2]
+        if previous_duration - shift > minimum + transition_duration:
+            selected[-2] = (previous_path, previous_duration - shift)
+            selected[-1] = (selected[-1][0], minimum)
+    return selected
+
+
+def available_memory():
+    """返回系统可用内存（字节），无法获取时返回 None。"""
+    try:
+        with open('/proc/meminfo', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def max_clip_workers(frame_exact, requested=0):
+    """根据 CPU 核数和可用内存计算剪辑进程数上限，requested 为 0 表示自动。"""
+    limit = os.cpu_count() or 1
+    memory = available_memory()
+    if memory is not None:
+        per_worker = (768 if frame_exact else 128) * 1024 * 1024  # 重新编码需要解码整帧，占用内存更多
+        limit = max(1, min(limit, memory // per_worker))
+    return min(requested, limit) if requested > 0 else limit
+
+
+def encoder_threads(workers=1, budget=0):
+    """同时运行 workers 个编码任务时，每个编码器可用的线程数，避免进程数乘以线程数超过可用核数。
+
+    budget 为可用的核数（引擎的 workers，作业进程中为作业占用的核数），0 表示 CPU 核数。
+    """
+    return max(1, (budget or os.cpu_count() or 1) // max(1, workers))
+
+
+def resolve_profiles(profiles=None):
+    """合并各阶段的编码档位与默认值，档位名未知时抛出 ValueError。"""
+    resolved = dict(DEFAULT_STAGE_PROFILES)
+    resolved.update(profiles or {})
+    unknown = sorted(set(resolved.values()) - set(ENCODER_PROFILES))
+    if unknown:
+        raise ValueError(f"未知的编码档位: {', '.join(unknown)}")
+    return resolved
+
+
+def profile_quality_args(name, encoder='libx264'):
+    """返回编码档位的 preset、crf 和帧内编码参数，只有 x264/x265 支持时才生效。"""
+    profile = ENCODER_PROFILES[name]
+    if encoder not in ('libx264', 'libx265'):
+        return []
+    args = ['-preset', profile['preset'], '-crf', str(profile['crf'])]
+    if profile.get('intra'):
+        args += ['-g', '1']  # 每帧都是关键帧，剪切和跳转不需要解码前面的帧
+    return args
+
+
+def profile_ffmpeg_args(name, threads=0, copy_audio=False):
+    """返回 ffmpeg 命令行中按编码档位编码视频和音频的参数（不含缩放），copy_audio 为真时音轨流复制。"""
+    profile = ENCODER_PROFILES[name]
+    args = ['-c:v', profile['codec']] + profile_quality_args(name, profile['codec']) + ['-pix_fmt', 'yuv420p']
+    if threads:
+        args += ['-threads', str(threads)]
+    if copy_audio:
+        return args + ['-c:a', 'copy']
+    return args + ['-c:a', 'aac', '-b:a', profile['audio_bitrate']]
+
+
+def profile_scale_filter(name):
+    """返回编码档位对应的 ffmpeg 缩放滤镜，不需要缩放时返回 None。"""
+    height = ENCODER_PROFILES[name].get('height')
+    return f"scale=-2:'min({height},ih)'" if height else None
+
+
+def profile_write_kwargs(name, threads=0):
+    """返回 moviepy write_videofile 按编码档位编码时的参数。"""
+    profile = ENCODER_PROFILES[name]
+    return {
+        'codec': profile['codec'],
+        'preset': profile['preset'],
+        'threads': threads or None,
+        'ffmpeg_params': ['-crf', str(profile['crf']), '-pix_fmt', 'yuv420p'] + (['-g', '1'] if profile.get('intra') else []),
+        'audio_codec': 'aac',
+        'audio_bitrate': profile['audio_bitrate'],
+    }
+
+
+def apply_profile(clip, name):
+    """按编码档位缩小 moviepy 片段的分辨率，只缩小不放大。"""
+    height = ENCODER_PROFILES[name].get('height')
+    if height and clip.h > height:
+        return clip.resize(height=height)
+    return clip
+
+
+def post_message(messages, kind, payload):
+    """工作进程向主进程发送日志或进度消息。"""
+    if messages is not None:
+        messages.put((kind, payload))
+
+
+def split_by_keyframes(video_path, output_folder, info, seed, scene_cuts=None, threads=0, messages=None):
+    """快速剪辑：切点对齐关键帧，一次解复用流复制切出片段，不重新编码。
+
+    在工作进程中运行：先用 seed（和镜头切换时间）规划片段边界并通过 'plan' 消息上报，再切出全部片段；
+    关键帧间隔过长、切点只能落在关键帧之间的片段用 threads 个编码线程重新编码。
+    """
+    keyframes = info.get('keyframes')
+    if keyframes is None:
+        keyframes = probe_keyframes(video_path)
+        post_message(messages, 'keyframes', {'video': video_path, 'keyframes': keyframes})
+
+    segments = plan_segments(info['duration'], keyframes, random.Random(seed), scene_cuts)
+    post_message(messages, 'plan', {'video': video_path, 'plan': segments})
+    post_message(messages, 'log', f"正在按关键帧切分: {os.path.basename(video_path)}，共 {len(segments)} 个片段")
+    return split_segments(video_path, output_folder, list(enumerate(segments)), keyframes, info['duration'],
+                          threads, True, messages)
+
+
+def split_segments(video_path, output_folder, segments, keyframes, duration, threads=0, replan=False, messages=None):
+    """按关键帧模式切出一组片段，segments 为 [(序号, (起点, 终点)), ...]。
+
+    起止点都在关键帧（或文件首尾）上的连续片段一次流复制切出，其余片段重新编码；流复制切出的片段数与规划
+    不一致且不能重新规划时，该区间也改为重新编码。replan 只在 segments 是整个文件的规划时传入；
+    keyframes 为 None 时重新探测。返回写出的片段列表。
+    """
+    if keyframes is None:
+        keyframes = probe_keyframes(video_path)
+    keyframe_set = set(keyframes)
+    runs = []
+    for item in segments:
+        start_time, end_time = item[1]
+        copyable = (start_time == 0 or start_time in keyframe_set) and (end_time >= duration or end_time in keyframe_set)
+        if runs and runs[-1][0] == copyable and item[0] == runs[-1][1][-1][0] + 1:
+            runs[-1][1].append(item)
+        else:
+            runs.append((copyable, [item]))
+
+    outputs = []
+    for copyable, run in runs:
+        if copyable:
+            try:
+                outputs += copy_segments(video_path, output_folder, run, messages, replan and len(runs) == 1)
+                continue
+            except RuntimeError as e:
+                post_message(messages, 'log', f"流复制切分失败，改为重新编码: {os.path.basename(video_path)}, 错误: {e}")
+        outputs += write_segments(video_path, output_folder, run, 'intermediate', threads, messages)
+    return outputs
+
+
+def copy_segments(video_path, output_folder, segments, messages=None, replan=False):
+    """流复制切出一段连续的片段，segments 为 [(序号, (起点, 终点)), ...]，切点都在关键帧上。
+
+    片段先写成临时文件，整段切分成功后再改名为正式文件名，并通过 'clip' 消息上报大小和时长。
+    replan 为真时，如果分段器实际切出的片段与规划不一致，以实际结果重新上报规划。返回写出的片段列表。
+    """
+    first_index, (range_start, _) = segments[0]
+    range_end = segments[-1][1][1]
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    temp_pattern = os.path.join(output_folder, f".seg_{base_name}_{first_index}_%05d.mp4")
+    segment_list = os.path.join(output_folder, f".seg_{base_name}_{first_index}.csv")
+    args = []
+    if range_start > 0:
+        args += ['-ss', f"{range_start + 0.001:.3f}"]  # 输入端定位到起点所在的关键帧
+    args += ['-i', video_path, '-t', f"{range_end - range_start:.3f}", '-map', '0:v:0', '-c', 'copy',
+             '-f', 'segment', '-reset_timestamps', '1',
+             '-segment_list', segment_list, '-segment_list_type', 'csv']
+    if len(segments) > 1:
+        # 切点稍微提前 1 毫秒，保证分段器落在目标关键帧上而不是下一个关键帧
+        args += ['-segment_times', ','.join(f"{end_time - range_start - 0.001:.3f}" for _, (_, end_time) in segments[:-1])]
+    args.append(temp_pattern)
+
+    try:
+        run_ffmpeg(args)
+        with open(segment_list, newline='', encoding='utf-8') as f:
+            rows = [(temp_name, range_start + float(start), range_start + float(end))
+                    for temp_name, start, end in csv.reader(f)]
+    finally:
+        if os.path.exists(segment_list):
+            os.remove(segment_list)
+
+    if len(rows) != len(segments):
+        if not replan:
+            for temp_name, _, _ in rows:
+                os.remove(os.path.join(output_folder, temp_name))
+            raise RuntimeError(f"切出 {len(rows)} 个片段，与规划的 {len(segments)} 个不一致")
+        # 按分段器实际写出的起止时间重新规划
+        segments = [(i, (start_time, end_time)) for i, (_, start_time, end_time) in enumerate(rows)]
+        post_message(messages, 'plan', {'video': video_path, 'plan': [segment for _, segment in segments]})
+
+    outputs = []
+    for (temp_name, start_time, end_time), (i, planned) in zip(rows, segments):
+        clip_name = segment_name(video_path, *planned)
+        clip_path = os.path.join(output_folder, clip_name)
+        os.replace(os.path.join(output_folder, temp_name), clip_path)
+        outputs.append({'video': video_path, 'index': i, 'name': clip_name,
+                        'size': os.path.getsize(clip_path), 'duration': end_time - start_time})
+        post_message(messages, 'clip', outputs[-1])
+    return outputs
+
+
+def write_segments(video_path, output_folder, segments, profile='intermediate', threads=0, messages=None):
+    """精确剪辑：逐段按编码档位重新编码写出一组片段，在工作进程中运行，segments 为 [(序号, (起点, 终点)), ...]。
+
+    每个片段先写成临时文件，成功后再改名，并用 ffprobe 复核时长后通过 'clip' 消息上报。返回写出的片段列表。
+    """
+    outputs = []
+    source = load_moviepy().VideoFileClip(video_path)
+    try:
+        video = apply_profile(source.without_audio(), profile)  # 删除音轨
+        for i, (start_time, end_time) in segments:
+            clip_name = segment_name(video_path, start_time, end_time)
+            clip_path = os.path.join(output_folder, clip_name)
+            temp_path = os.path.join(output_folder, f".part_{clip_name}")
+            post_message(messages, 'log', f"正在剪辑片段: {clip_name}")
+            try:
+                video.subclip(start_time, end_time).write_videofile(temp_path, logger=None,
+                                                                    **profile_write_kwargs(profile, threads))
+                os.replace(temp_path, clip_path)
+                duration = probe_media(clip_path)['duration']
+            except Exception as e:
+                post_message(messages, 'log', f"无法保存剪辑片段: {clip_name}, 错误: {e}")
+                continue
+            outputs.append({'video': video_path, 'index': i, 'name': clip_name,
+                            'size': os.path.getsize(clip_path), 'duration': duration})
+            post_message(messages, 'clip', outputs[-1])
+    finally:
+        source.close()
+    return outputs
+
+
+def run_timed_task(func, *args):
+    """在工作进程中执行剪辑任务，结束后通过 'task' 消息上报耗时、片段时长和写出的字节数。"""
+    messages = args[-1]
+    start = time.perf_counter()
+    outputs = []
+    try:
+        outputs = func(*args)
+        return outputs
+    finally:
+        post_message(messages, 'task', {'video': args[0], 'elapsed': time.perf_counter() - start,
+                                        'duration': sum(output['duration'] for output in outputs),
+                                        'bytes': sum(output['size'] for output in outputs)})
+
+
+def media_signature(info):
+    """决定能否流复制拼接的编码参数：编码、profile、level、分辨率、帧率、像素格式、时间基和音频参数。"""
+    keys = ('codec', 'profile', 'level', 'width', 'height', 'pix_fmt', 'time_base', 'audio_codec', 'sample_rate',
+            'channels')
+    return tuple(info.get(key) for key in keys) + (round(info.get('fps', 0), 3),)
+
+
+def concat_copy_compatible(infos):
+    """判断一组视频能否直接流复制拼接，即所有视频的编码参数都一致。"""
+    first = media_signature(infos[0])
+    return all(media_signature(info) == first for info in infos)
+
+
+def encoder_profile_args(info, encoder):
+    """返回让编码器输出与 info 相同 profile 和 level 的参数，无法对应时返回 None。
+
+    concat 解复用器流复制拼接 mp4 时只保留第一个文件的解码配置（avcC/hvcC），片头的 SPS/PPS 必须与目标一致，
+    否则目标视频会按片头的参数解码而花屏。
+    """
+    names = ENCODER_PROFILE_NAMES.get(encoder)
+    if names is None:
+        return []  # 其他编码器的码流参数不依赖容器中的解码配置
+    profile = names.get(info.get('profile'))
+    level = info.get('level')
+    if profile is None or not level or level <= 0:
+        return None
+    if encoder == 'libx264':
+        return ['-profile:v', profile, '-level', f"{level // 10}.{level % 10}"]  # ffprobe 的 level 为 10 倍，如 40
+    return ['-profile:v', profile, '-x265-params', f"level-idc={level / 30:g}"]  # HEVC 的 level 为 30 倍，如 120
+
+
+def file_digest(path, extra=''):
+    """计算文件内容的 SHA-1（可附加参数字符串），用作缓存键。"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    digest.update(extra.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def normalize_header(header_file, header_info, target, cache_folder, profile='delivery', threads=0):
+    """把片头转码成与目标视频相同的编码、profile、level、分辨率、帧率、像素格式和时间基。
+
+    画质按编码档位的 preset 和 crf 设置（分辨率必须与目标一致，不使用档位的缩放）。
+    结果按片头内容哈希、目标参数和档位缓存，同一批参数只转码一次；目标编码没有对应编码器，
+    或目标的 profile/level 无法对应到编码器参数时返回 None。
+    """
+    encoder = VIDEO_ENCODERS.get(target['codec'])
+    audio_encoder = AUDIO_ENCODERS.get(target['audio_codec']) if target['audio_codec'] else None
+    if encoder is None or (target['audio_codec'] and audio_encoder is None):
+        return None
+    codec_args = encoder_profile_args(target, encoder)
+    if codec_args is None:
+        return None
+
+    os.makedirs(cache_folder, exist_ok=True)
+    digest = file_digest(header_file, repr((media_signature(target), profile)))
+    cached_path = os.path.join(cache_folder, f"header_{digest[:16]}.mp4")
+    if os.path.exists(cached_path):
+        return cached_path
+
+    width, height = target['width'], target['height']
+    fps = Fraction(target['fps']).limit_denominator(1001)
+    video_filter = (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                    f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps},format={target['pix_fmt']}")
+    args = ['-i', header_file]
+    if audio_encoder and not header_info.get('audio_codec'):
+        # 片头没有音轨时补一段静音，保证与目标视频的流布局一致
+        layout = 'mono' if target['channels'] == 1 else 'stereo'
+        args += ['-f', 'lavfi', '-i', f"anullsrc=r={target['sample_rate']}:cl={layout}", '-shortest']
+    args += ['-map', '0:v:0', '-vf', video_filter, '-c:v', encoder] + profile_quality_args(profile, encoder) + codec_args
+    if threads:
+        args += ['-threads', str(threads)]
+    timescale = target['time_base'].partition('/')[2]
+    if timescale:
+        args += ['-video_track_timescale', timescale]
+    if audio_encoder:
+        args += ['-map', '0:a:0' if header_info.get('audio_codec') else '1:a:0', '-c:a', audio_encoder,
+                 '-ar', str(target['sample_rate']), '-ac', str(target['channels'])]
+    else:
+        args.append('-an')
+
+    temp_path = cached_path + '.part'
+    run_ffmpeg(args + ['-f', 'mp4', temp_path])
+    os.replace(temp_path, cached_path)  # 转码成功后再放入缓存，避免留下不完整的片头
+    return cached_path
+
+
+def write_concat_list(paths, list_path, outpoints=None):
+    """写出 concat 解复用器的文件列表，outpoints 中不为 None 的项在该时间处截断对应文件。"""
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for path, outpoint in zip(paths, outpoints or [None] * len(paths)):
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+            if outpoint is not None:
+                f.write(f"outpoint {outpoint:.6f}\n")
+
+
+def concat_by_stream_copy(paths, output_path, on_frames=None, outpoints=None):
+    """用 concat 解复用器一次性流复制拼接所有视频，不重新编码；outpoints 见 write_concat_list。"""
+    list_path = os.path.join(os.path.dirname(output_path), f".{os.path.basename(output_path)}.concat.txt")
+    write_concat_list(paths, list_path, outpoints)
+    try:
+        run_ffmpeg(['-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', output_path], on_frames)
+    finally:
+        os.remove(list_path)
+
+
+def trim_outpoints(selected, infos):
+    """返回 concat 列表中各片段的截断时间：使用时长短于片段时长（超过 1 毫秒）时截断，否则为 None。"""
+    return [duration if duration < infos[clip_path]['duration'] - 0.001 else None for clip_path, duration in selected]
+
+
+def variant_name(file_name, index, variants):
+    """多版本输出时在文件名后加上从 1 开始的三位序号，只有一个版本时保持原名。"""
+    if variants <= 1:
+        return file_name
+    base_name, extension = os.path.splitext(file_name)
+    return f"{base_name}_{index + 1:03d}{extension}"
+
+
+def pipe_to_ffmpeg(args, chunks):
+    """执行 ffmpeg 命令并把 chunks（bytes 的可迭代对象）逐块写入它的标准输入，失败时抛出 RuntimeError。"""
+    cmd = [FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-y'] + list(args)
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr_tail = drain_stderr(process)
+    try:
+        for data in chunks:
+            process.stdin.write(data)
+        process.stdin.close()
+    except BrokenPipeError:
+        pass  # ffmpeg 提前退出，错误信息在 stderr 中
+    except BaseException:
+        process.kill()
+        process.wait()
+        stderr_tail()
+        raise
+    process.wait()
+    error = stderr_tail()
+    if process.returncode != 0:
+        raise RuntimeError(error)
+
+
+def decode_audio(audio_path, cache_folder, sample_rate=AUDIO_SAMPLE_RATE):
+    """把音频解码为 (采样数, 2) 的 float32 数组。
+
+    解码结果按文件内容哈希缓存为 .npy，之后以内存映射方式读取，同一首音乐在整个批次中只解码一次。
+    """
+    os.makedirs(cache_folder, exist_ok=True)
+    cached_path = os.path.join(cache_folder, f"audio_{file_digest(audio_path, str(sample_rate))[:16]}.npy")
+    if not os.path.exists(cached_path):
+        cmd = [FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-i', audio_path, '-vn',
+               '-f', 'f32le', '-ac', '2', '-ar', str(sample_rate), 'pipe:1']
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode('utf-8', 'replace').strip())
+        samples = np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, 2)
+        temp_path = cached_path + '.part'
+        with open(temp_path, 'wb') as f:
+            np.save(f, samples)
+        os.replace(temp_path, cached_path)
+    return np.load(cached_path, mmap_mode='r')
+
+
+def mix_audio_chunks(duration, music=None, voice=None, volume=0.3, sample_rate=AUDIO_SAMPLE_RATE,
+                     fade_in=1.0, fade_out=2.0, chunk_seconds=10):
+    """按块生成 duration 秒的混音：背景音乐循环播放、乘以音量并淡入淡出，再叠加配音。
+
+    每块是 (采样数, 2) 的 float32 数组，整段计算都是向量运算，内存占用与视频长度无关。
+    """
+    total = int(round(duration * sample_rate))
+    chunk_size = int(chunk_seconds * sample_rate)
+    for start in range(0, total, chunk_size):
+        end = min(start + chunk_size, total)
+        positions = np.arange(start, end)
+        mixed = np.zeros((end - start, 2), dtype=np.float32)
+        if music is not None and len(music):
+            gain = np.full(end - start, volume, dtype=np.float32)
+            if fade_in > 0:
+                gain *= np.clip(positions / (fade_in * sample_rate), 0, 1)
+            if fade_out > 0:
+                gain *= np.clip((total - positions) / (fade_out * sample_rate), 0, 1)
+            mixed += music[positions % len(music)] * gain[:, None]  # 音乐比视频短时循环
+        if voice is not None and start < len(voice):
+            part = voice[start:end]
+            mixed[:len(part)] += part
+        np.clip(mixed, -1, 1, out=mixed)
+        yield mixed
+
+
+def output_name(prefix, video_path):
+    """批处理结果的文件名：prefix 加原文件名，扩展名统一为 .mp4，与 ffmpeg 写出的 MP4 封装一致。"""
+    return f"{prefix}{os.path.splitext(os.path.basename(video_path))[0]}.mp4"
+
+
+def mux_audio(video_path, output_path, chunks, keep_original=False, sample_rate=AUDIO_SAMPLE_RATE):
+    """把混音（float32 双声道块）通过管道交给 ffmpeg，与视频轨一起写入 output_path，视频轨流复制不重新编码。
+
+    keep_original 为真时混音与视频原有音轨叠加，否则替换原有音轨。
+    """
+    args = ['-i', video_path, '-f', 'f32le', '-ar', str(sample_rate), '-ac', '2', '-i', 'pipe:0']
+    if keep_original:
+        args += ['-filter_complex', f"[0:a:0]aresample={sample_rate}[a0];[a0][1:a]amix=inputs=2:duration=first:normalize=0[a]",
+                 '-map', '0:v:0', '-map', '[a]']
+    else:
+        args += ['-map', '0:v:0', '-map', '1:a:0']
+    temp_path = output_path + '.part'
+    pipe_to_ffmpeg(args + ['-c:v', 'copy', '-c:a', 'aac', '-b:a', '192k', '-f', 'mp4', temp_path],
+                   (chunk.tobytes() for chunk in chunks))
+    os.replace(temp_path, output_path)
+
+
+class Watermark:
+    """图片水印。
+
+    position 为位置名称（左上、右上、左下、右下、居中）或像素坐标 'x,y'；size 为视频宽度的百分比（'15%'）、
+    像素宽度（'200' 或 '200px'，高度按比例）或 '宽x高'。图片按目标分辨率缩放，每种分辨率只处理一次；
+    既可以生成 ffmpeg 的 overlay 滤镜（PNG 保持非预乘 alpha），也可以在 moviepy 的重新编码中逐帧叠加（预乘 alpha）。
+    """
+    MARGIN = 20  # 位置名称对应的水印与画面边缘的距离（像素）
+
+    def __init__(self, image_path, position='右下', size='15%', cache_folder=None):
+        self.image_path = image_path
+        self.position = position.strip() or '右下'
+        self.size = size.strip().lower() or '15%'
+        self.cache_folder = cache_folder
+        self._image = None
+        self._scaled = {}
+        self._png_paths = {}
+        self._lock = threading.Lock()
+        self.layout(1920, 1080, (1, 1))  # 提前检查位置和大小格式，无效时抛出 ValueError
+
+    def layout(self, width, height, image_size):
+        """计算水印在 width x height 画面中的 (宽, 高, x, y)，水印不会超出画面。"""
+        image_width, image_height = image_size
+        size = self.size[:-2] if self.size.endswith('px') else self.size
+        if size.endswith('%'):
+            mark_width = round(width * float(size[:-1]) / 100)
+            mark_height = round(mark_width * image_height / image_width)
+        elif 'x' in size:
+            mark_width, mark_height = map(int, size.split('x'))
+        else:
+            mark_width = int(size)
+            mark_height = round(mark_width * image_height / image_width)
+        mark_width = max(1, min(mark_width, width))
+        mark_height = max(1, min(mark_height, height))
+
+        if self.position in WATERMARK_POSITIONS:
+            fx, fy = WATERMARK_POSITIONS[self.position]
+            x = self.MARGIN + fx * max(width - mark_width - 2 * self.MARGIN, 0)
+            y = self.MARGIN + fy * max(height - mark_height - 2 * self.MARGIN, 0)
+        else:
+            x, y = map(int, self.position.replace('，', ',').split(','))
+        x = int(min(max(x, 0), width - mark_width))
+        y = int(min(max(y, 0), height - mark_height))
+        return mark_width, mark_height, x, y
+
+    def resized(self, width, height):
+        """返回 width x height 画面中缩放好的 RGBA 水印图片（PIL Image）和位置 (x, y)，调用方需持有锁。"""
+        from PIL import Image
+        if self._image is None:
+            self._image = Image.open(self.image_path).convert('RGBA')
+        mark_width, mark_height, x, y = self.layout(width, height, self._image.size)
+        return self._image.resize((mark_width, mark_height), Image.LANCZOS), x, y
+
+    def for_resolution(self, width, height):
+        """返回 (预乘 alpha 的 RGB, alpha, x, y)，RGB 为 0~255 的 float32，alpha 为 0~1；结果按分辨率缓存。"""
+        with self._lock:
+            if (width, height) not in self._scaled:
+                image, x, y = self.resized(width, height)
+                rgba = np.asarray(image, dtype=np.float32)
+                alpha = rgba[:, :, 3:] / 255
+                self._scaled[(width, height)] = (rgba[:, :, :3] * alpha, alpha, x, y)
+            return self._scaled[(width, height)]
+
+    def png_path(self, width, height):
+        """把该分辨率下缩放好的水印保存为 PNG 缓存并返回路径，供 ffmpeg overlay 使用。
+
+        PNG 保持非预乘的 alpha：overlay 默认在 yuv420 中混合，预乘数据转换到有限范围后透明处的亮度为 16，
+        按预乘方式叠加会让整个水印框区域发灰。
+        """
+        with self._lock:
+            if (width, height) not in self._png_paths:
+                os.makedirs(self.cache_folder, exist_ok=True)
+                digest = file_digest(self.image_path, f"{self.size}|{width}x{height}")
+                cached_path = os.path.join(self.cache_folder, f"watermark_{digest[:16]}.png")
+                if not os.path.exists(cached_path):
+                    image, _, _ = self.resized(width, height)
+                    temp_path = cached_path + '.part'
+                    image.save(temp_path, format='PNG')
+                    os.replace(temp_path, cached_path)
+                self._png_paths[(width, height)] = cached_path
+            return self._png_paths[(width, height)]
+
+    def overlay_filter(self, width, height):
+        """返回把第二个输入（png_path 的图片）叠加到画面上的 ffmpeg overlay 滤镜。"""
+        _, _, x, y = self.for_resolution(width, height)
+        return f"overlay={x}:{y}"
+
+    def apply(self, clip):
+        """在 moviepy 片段上逐帧叠加水印，与其他重新编码在同一次编码中完成。"""
+        rgb, alpha, x, y = self.for_resolution(clip.w, clip.h)
+        return clip.fl_image(lambda frame: blend_rgba(frame.copy(), rgb, alpha, x, y))  # moviepy 返回的帧可能是只读的
+
+
+def blend_rgba(frame, rgb, alpha, x, y):
+    """把预乘 alpha 的图像原地叠加到 frame 的 (x, y) 处，超出画面的部分被裁掉，返回 frame。"""
+    height, width = frame.shape[:2]
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + alpha.shape[1], width), min(y + alpha.shape[0], height)
+    if x0 >= x1 or y0 >= y1:
+        return frame
+    source = (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x))
+    region = frame[y0:y1, x0:x1].astype(np.float32)
+    frame[y0:y1, x0:x1] = (region * (1 - alpha[source]) + rgb[source] + 0.5).astype(np.uint8)
+    return frame
+
+
+def list_system_fonts():
+    """查找系统中的 TrueType/OpenType 字体，返回 {字体文件名: 路径}，按名称排序。"""
+    fonts = {}
+    for folder in FONT_FOLDERS:
+        for root, _, file_names in os.walk(folder):
+            for file_name in file_names:
+                name, ext = os.path.splitext(file_name)
+                if ext.lower() in ('.ttf', '.ttc', '.otf'):
+                    fonts.setdefault(name, os.path.join(root, file_name))
+    return dict(sorted(fonts.items()))
+
+
+def parse_srt(text):
+    """解析 SRT 字幕，返回按开始时间排序的 [(开始秒, 结束秒, 文本), ...]。"""
+    time_line = re.compile(r'(\d+):(\d+):(\d+)[,.](\d+)\s*-->\s*(\d+):(\d+):(\d+)[,.](\d+)')
+    cues = []
+    current = None
+    for line in text.splitlines():
+        match = time_line.search(line)
+        if match:
+            h1, m1, s1, f1, h2, m2, s2, f2 = match.groups()
+            current = [int(h1) * 3600 + int(m1) * 60 + int(s1) + int(f1) / 10 ** len(f1),
+                       int(h2) * 3600 + int(m2) * 60 + int(s2) + int(f2) / 10 ** len(f2), []]
+            cues.append(current)
+        elif not line.strip():
+            current = None  # 空行结束当前字幕
+        elif current is not None:
+            current[2].append(re.sub(r'<[^>]+>', '', line.strip()))  # 去掉 <i> 等格式标签
+    return sorted((start, end, '\n'.join(lines)) for start, end, lines in cues if lines and end > start)
+
+
+def parse_ass_time(value):
+    """把 ASS 的时间 'H:MM:SS.cc' 转换为秒。"""
+    hours, minutes, seconds = value.strip().split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def parse_ass(text):
+    """解析 ASS/SSA 字幕的 [Events] 部分，去掉样式覆盖标签，返回按开始时间排序的 [(开始秒, 结束秒, 文本), ...]。"""
+    cues = []
+    fields = None
+    in_events = False
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('['):
+            in_events = line.lower() == '[events]'
+            continue
+        key, _, value = line.partition(':')
+        if not in_events:
+            continue
+        if key == 'Format':
+            fields = [field.strip().lower() for field in value.split(',')]
+        elif key == 'Dialogue' and fields:
+            row = dict(zip(fields, value.strip().split(',', len(fields) - 1)))  # 文本中可能含有逗号
+            content = re.sub(r'\{[^}]*\}', '', row.get('text', ''))
+            content = content.replace('\\N', '\n').replace('\\n', '\n').replace('\\h', ' ').strip()
+            start, end = parse_ass_time(row['start']), parse_ass_time(row['end'])
+            if content and end > start:
+                cues.append((start, end, content))
+    return sorted(cues)
+
+
+def load_subtitles(subtitle_path):
+    """按扩展名读取 SRT 或 ASS/SSA 字幕文件。"""
+    with open(subtitle_path, encoding='utf-8-sig', errors='replace') as f:
+        text = f.read()
+    if subtitle_path.lower().endswith(('.ass', '.ssa')):
+        return parse_ass(text)
+    return parse_srt(text)
+
+
+def find_subtitle_file(video_path):
+    """查找与视频同名的 .srt/.ass/.ssa 字幕文件，找不到时返回 None。"""
+    base_path = os.path.splitext(video_path)[0]
+    for ext in ('.srt', '.ass', '.ssa'):
+        if os.path.exists(base_path + ext):
+            return base_path + ext
+    return None
+
+
+class SubtitleRenderer:
+    """把字幕文本渲染成预乘 alpha 的图像。
+
+    每个不同的文本只渲染一次，结果按 (文本, 字体, 字号, 样式) 缓存在所有渲染器共享的 LRU 缓存中。
+    """
+    MAX_CACHED = 256  # 缓存的字幕图像数量上限
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    def __init__(self, font_path, size=48, style='白字黑边'):
+        if style not in SUBTITLE_STYLES:
+            raise ValueError(f"未知的字幕样式: {style}")
+        if not font_path or not os.path.exists(font_path):
+            raise ValueError(f"字体文件不存在: {font_path}")
+        self.font_path = font_path
+        self.size = size
+        self.style = style
+        self._font = None
+
+    def render(self, text):
+        """返回文本图像 (预乘 alpha 的 RGB, alpha)，RGB 为 0~255 的 float32，alpha 为 0~1。"""
+        key = (text, self.font_path, self.size, self.style)
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        bitmap = self._draw(text)
+        with self._cache_lock:
+            self._cache[key] = bitmap
+            while len(self._cache) > self.MAX_CACHED:
+                self._cache.popitem(last=False)
+        return bitmap
+
+    def _draw(self, text):
+        """用 PIL 绘制一行或多行居中的字幕文本。"""
+        from PIL import Image, ImageDraw, ImageFont
+        if self._font is None:
+            self._font = ImageFont.truetype(self.font_path, self.size)
+        spec = SUBTITLE_STYLES[self.style]
+        stroke_width = max(1, self.size // 16) if spec['stroke'] else 0
+        left, top, right, bottom = ImageDraw.Draw(Image.new('RGBA', (1, 1))).multiline_textbbox(
+            (0, 0), text, font=self._font, stroke_width=stroke_width, align='center')
+        padding = self.size // 4 if spec['box'] else 0
+        size = (right - left + 2 * padding, bottom - top + 2 * padding)
+        image = Image.new('RGBA', size, (0, 0, 0, 0))
+        ImageDraw.Draw(image).multiline_text((padding - left, padding - top), text, font=self._font,
+                                             fill=spec['fill'], stroke_width=stroke_width,
+                                             stroke_fill=spec['stroke'], align='center')
+        if spec['box']:
+            image = Image.alpha_composite(Image.new('RGBA', size, spec['box']), image)
+        rgba = np.asarray(image, dtype=np.float32)
+        alpha = rgba[:, :, 3:] / 255
+        return rgba[:, :, :3] * alpha, alpha
+
+
+def read_frames(stream, width, height):
+    """从 rgb24 原始视频流中逐帧读取，所有帧共用同一块可写缓冲区，生成 (H, W, 3) 的 uint8 数组。"""
+    frame_size = width * height * 3
+    buffer = bytearray(frame_size)
+    view = memoryview(buffer)
+    frame = np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, 3)
+    while True:
+        received = 0
+        while received < frame_size:
+            count = stream.readinto(view[received:])
+            if not count:
+                return
+            received += count
+        yield frame
+
+
+def subtitle_frames(frames, fps, cues, renderer, watermark=None, on_frame=None):
+    """在帧序列上叠加字幕（以及可选的水印），生成每帧的字节数据。
+
+    只有字幕出现的帧才做混合，同时出现的多条字幕自下而上排列；每帧调用一次 on_frame。
+    """
+    next_cue = 0
+    active = []
+    mark = None
+    for index, frame in enumerate(frames):
+        height, width = frame.shape[:2]
+        t = index / fps
+        while next_cue < len(cues) and cues[next_cue][0] <= t:
+            active.append(cues[next_cue])
+            next_cue += 1
+        active = [cue for cue in active if cue[1] > t]
+
+        y = height - renderer.size  # 字幕底边与画面底部的距离为一个字号
+        for _, _, text in reversed(active):
+            rgb, alpha = renderer.render(text)
+            y -= alpha.shape[0]
+            blend_rgba(frame, rgb, alpha, (width - alpha.shape[1]) // 2, y)
+            y -= renderer.size // 4
+        if watermark is not None:
+            mark = mark or watermark.for_resolution(width, height)
+            blend_rgba(frame, *mark)
+        yield frame.data
+        if on_frame:
+            on_frame()
+
+
+def analyze_scenes(video_path, cache_folder, on_frames=None, batch=256):
+    """计算每帧相对前一帧的镜头切换分数（0~1），第 0 帧为 0。
+
+    画面只解码一次并缩小为灰度小图，按批向量化计算平均绝对差和 16 级直方图差，分数取两者的几何平均：
+    运动画面的平均绝对差大但直方图变化小，只有真正的镜头切换两者都大。
+    分数按源文件缓存为 .npy，换用不同阈值或片段长度重新规划时不需要再解码。
+    """
+    os.makedirs(cache_folder, exist_ok=True)
+    cached_path = os.path.join(cache_folder, f"scenes_{source_key(video_path)}.npy")
+    if os.path.exists(cached_path):
+        return np.load(cached_path)
+
+    width, height = SCENE_ANALYSIS_SIZE
+    frame_size = width * height
+    process = subprocess.Popen([FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-i', video_path,
+                                '-map', '0:v:0', '-vf', f"scale={width}:{height}:flags=area,format=gray",
+                                '-f', 'rawvideo', '-pix_fmt', 'gray', 'pipe:1'],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    scores = [np.zeros(1, dtype=np.float32)]
+    previous = None
+    try:
+        while True:
+            data = process.stdout.read(frame_size * batch)
+            count = len(data) // frame_size
+            if count == 0:
+                break
+            frames = np.frombuffer(data, dtype=np.uint8, count=count * frame_size).reshape(count, frame_size)
+            if previous is not None:
+                frames = np.vstack([previous, frames])  # 与上一批的最后一帧比较
+            previous = frames[-1:]
+            mad = np.abs(np.diff(frames.astype(np.int16), axis=0)).mean(axis=1) / 255
+            bins = (frames >> 4) + np.arange(len(frames))[:, None] * 16  # 每帧 16 级直方图，一次 bincount 算完整批
+            histograms = np.bincount(bins.ravel(), minlength=len(frames) * 16).reshape(-1, 16) / frame_size
+            histogram_diff = np.abs(np.diff(histograms, axis=0)).sum(axis=1) / 2
+            scores.append(np.sqrt(mad * histogram_diff).astype(np.float32))
+            if on_frames:
+                on_frames(count)
+    finally:
+        process.stdout.close()
+        process.wait()
+    if process.returncode != 0 or previous is None:
+        raise RuntimeError("无法解码视频画面")
+
+    scores = np.concatenate(scores)
+    temp_path = cached_path + '.part'
+    with open(temp_path, 'wb') as f:
+        np.save(f, scores)
+    os.replace(temp_path, cached_path)
+    return scores
+
+
+def scene_cut_times(scores, fps, threshold=SCENE_THRESHOLD):
+    """返回镜头切换分数达到阈值的帧的时间（秒）。"""
+    return (np.flatnonzero(scores >= threshold) / fps).tolist()
+
+
+class RenderPlan:
+    """一个成片的渲染计划：片头 + 拼接片段（可带随机转场）+ 水印 + 预混音频。
+
+    能流复制时直接用 concat 解复用器拼接，片头按片段参数预转码一次并缓存；否则构建一个 filter_complex，
+    成片只解码一次、编码一次、写一次，不产生中间文件。输出的分辨率和帧率与第一个片段一致。
+    """
+
+    def __init__(self, segments, infos, header_file=None, header_info=None, watermark=None, audio_path=None,
+                 transition_duration=0, profile='delivery', rng=random):
+        self.segments = segments  # [(片段路径, 时长), ...]
+        self.infos = infos
+        self.header_file = header_file
+        self.header_info = header_info
+        self.watermark = watermark
+        self.audio_path = audio_path  # 预混好的 f32le 双声道音频，与视频原有音轨叠加
+        self.transition_duration = transition_duration
+        self.profile = profile
+        self.rng = rng
+        self.target = infos[segments[0][0]]
+
+    @property
+    def body_duration(self):
+        """拼接部分的时长，扣除转场重叠。"""
+        return sum(duration for _, duration in self.segments) - self.transition_duration * (len(self.segments) - 1)
+
+    @property
+    def duration(self):
+        """成片时长。"""
+        return self.body_duration + (self.header_info['duration'] if self.header_file else 0)
+
+    def can_stream_copy(self):
+        """没有转场、水印和混音，且所有片段编码参数一致时可以流复制拼接。"""
+        return (self.transition_duration <= 0 and self.watermark is None and self.audio_path is None
+                and concat_copy_compatible([self.infos[path] for path, _ in self.segments]))
+
+    def copy_inputs(self, cache_folder, threads=0):
+        """返回流复制拼接的 (文件列表, 截断时间列表)，预转码的片头在最前；片头无法预转码成片段参数时返回 None。"""
+        paths = [path for path, _ in self.segments]
+        outpoints = trim_outpoints(self.segments, self.infos)
+        if self.header_file:
+            normalized_header = normalize_header(self.header_file, self.header_info, self.target, cache_folder,
+                                                 self.profile, threads)
+            if normalized_header is None:
+                return None
+            paths.insert(0, normalized_header)
+            outpoints.insert(0, None)
+        return paths, outpoints
+
+    def ffmpeg_args(self, output_path, list_path, threads=0):
+        """构建一次编码完成整个成片的 ffmpeg 参数，需要 concat 列表时写入 list_path。"""
+        width, height = self.target['width'], self.target['height']
+        fps = Fraction(self.target['fps']).limit_denominator(1001)
+        inputs = []
+        filters = []
+
+        def add_input(*args):
+            inputs.append(list(args))
+            return len(inputs) - 1
+
+        def video(label, output):
+            filters.append(f"[{label}]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                           f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps},format=yuv420p,"
+                           f"settb=AVTB[{output}]")
+
+        def audio(label, output, has_audio, duration):
+            if has_audio:
+                filters.append(f"[{label}]aresample={AUDIO_SAMPLE_RATE},"
+                               f"aformat=sample_fmts=fltp:channel_layouts=stereo[{output}]")
+            else:  # 没有音轨的部分补静音，保证各部分都能按音视频成对拼接
+                filters.append(f"anullsrc=r={AUDIO_SAMPLE_RATE}:cl=stereo,atrim=duration={duration:.3f}[{output}]")
+
+        segment_infos = [self.infos[path] for path, _ in self.segments]
+        if self.transition_duration <= 0 and concat_copy_compatible(segment_infos):
+            # 片段参数一致：用 concat 解复用器作为一个输入，不必同时打开所有片段
+            write_concat_list([path for path, _ in self.segments], list_path, trim_outpoints(self.segments, self.infos))
+            body = add_input('-f', 'concat', '-safe', '0', '-i', list_path)
+            video(f"{body}:v:0", 'bv')
+            audio(f"{body}:a:0", 'ba', all(info['audio_codec'] for info in segment_infos), self.body_duration)
+        else:
+            for i, (path, duration) in enumerate(self.segments):
+                index = add_input('-t', f"{duration:.6f}", '-i', path)  # 片段可能被截短以补足精确时长
+                video(f"{index}:v:0", f"v{i}")
+                audio(f"{index}:a:0", f"a{i}", bool(self.infos[path]['audio_codec']), duration)
+            count = len(self.segments)
+            if count == 1:
+                filters += ['[v0]null[bv]', '[a0]anull[ba]']
+            elif self.transition_duration <= 0:
+                filters.append(''.join(f"[v{i}][a{i}]" for i in range(count)) + f"concat=n={count}:v=1:a=1[bv][ba]")
+            else:
+                offset = 0
+                previous_video, previous_audio = 'v0', 'a0'
+                for i in range(1, count):
+                    offset += self.segments[i - 1][1] - self.transition_duration  # 转场从上一段结束前开始
+                    video_label, audio_label = ('bv', 'ba') if i == count - 1 else (f"xv{i}", f"xa{i}")
+                    filters.append(f"[{previous_video}][v{i}]xfade=transition={self.rng.choice(XFADE_TRANSITIONS)}:"
+                                   f"duration={self.transition_duration}:offset={offset:.3f}[{video_label}]")
+                    filters.append(f"[{previous_audio}][a{i}]acrossfade=d={self.transition_duration}[{audio_label}]")
+                    previous_video, previous_audio = video_label, audio_label
+
+        video_label, audio_label = 'bv', 'ba'
+        if self.header_file:
+            header = add_input('-i', self.header_file)
+            video(f"{header}:v:0", 'hv')
+            audio(f"{header}:a:0", 'ha', bool(self.header_info['audio_codec']), self.header_info['duration'])
+            filters.append('[hv][ha][bv][ba]concat=n=2:v=1:a=1[cv][ca]')
+            video_label, audio_label = 'cv', 'ca'
+        if self.watermark is not None:
+            mark = add_input('-i', self.watermark.png_path(width, height))
+            filters.append(f"[{video_label}][{mark}:v]{self.watermark.overlay_filter(width, height)}[wv]")
+            video_label = 'wv'
+        if profile_scale_filter(self.profile):
+            filters.append(f"[{video_label}]{profile_scale_filter(self.profile)}[sv]")
+            video_label = 'sv'
+        if self.audio_path:
+            music = add_input('-f', 'f32le', '-ar', str(AUDIO_SAMPLE_RATE), '-ac', '2', '-i', self.audio_path)
+            filters.append(f"[{audio_label}][{music}:a]amix=inputs=2:duration=first:normalize=0[ma]")
+            audio_label = 'ma'
+
+        args = [arg for input_args in inputs for arg in input_args]
+        args += ['-filter_complex', ';'.join(filters), '-map', f"[{video_label}]", '-map', f"[{audio_label}]"]
+        return args + profile_ffmpeg_args(self.profile, threads) + ['-f', 'mp4', output_path]
+
+
+def source_key(path):
+    """按路径、大小和修改时间生成缓存键，不读取文件内容，大文件也能立即得到。"""
+    stat = os.stat(path)
+    return hashlib.sha1(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode('utf-8')).hexdigest()[:16]
+
+
+def make_proxy(video_path, cache_folder, threads=0, on_start=None):
+    """生成低分辨率、全帧内编码的预览代理文件，拖动时任意位置都能快速定位；已存在时直接返回路径。
+
+    on_start 见 run_ffmpeg；生成失败或被结束时删除临时文件。
+    """
+    os.makedirs(cache_folder, exist_ok=True)
+    proxy_path = os.path.join(cache_folder, f"proxy_{source_key(video_path)}.mp4")
+    if not os.path.exists(proxy_path):
+        temp_path = proxy_path + '.part'
+        try:
+            run_ffmpeg(['-i', video_path, '-vf', profile_scale_filter('proxy')] + profile_ffmpeg_args('proxy', threads)
+                       + ['-f', 'mp4', temp_path], on_start=on_start)
+            os.replace(temp_path, proxy_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return proxy_path
+
+
+def make_thumbnail_strip(video_path, cache_folder, duration, count=8, height=72, on_start=None):
+    """把视频等间隔取 count 帧拼成一行缩略图（ffmpeg tile 滤镜），结果缓存为 PNG 并返回路径。"""
+    os.makedirs(cache_folder, exist_ok=True)
+    strip_path = os.path.join(cache_folder, f"thumbs_{source_key(video_path)}_{count}x{height}.png")
+    if not os.path.exists(strip_path):
+        temp_path = strip_path[:-4] + '.part.png'
+        rate = count / max(duration, 0.001)
+        try:
+            run_ffmpeg(['-i', video_path, '-vf', f"fps={rate:.6f},scale=-2:{height},tile={count}x1",
+                        '-frames:v', '1', '-c:v', 'png', temp_path], on_start=on_start)
+            os.replace(temp_path, strip_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return strip_path
+
+
+def decode_frames(video_path, start_time, count, width, height):
+    """从 start_time 开始解码最多 count 帧 rgb24 画面并缩放到 width x height，返回 (H, W, 3) 数组的列表。"""
+    process = subprocess.Popen([FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-ss', f"{start_time:.3f}",
+                                '-i', video_path, '-frames:v', str(count), '-vf', f"scale={width}:{height}",
+                                '-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:1'],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        return [frame.copy() for frame in read_frames(process.stdout, width, height)]
+    finally:
+        process.stdout.close()
+        process.wait()
+
+
+class FrameCache:
+    """线程安全的解码画面 LRU 缓存，键为 (文件路径, 帧号)。"""
+
+    def __init__(self, max_frames=120):
+        self.max_frames = max_frames
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._frames
+
+    def get(self, key):
+        """返回缓存的画面并标记为最近使用，不存在时返回 None。"""
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+            return frame
+
+    def put(self, key, frame):
+        """放入画面，超过上限时淘汰最久未使用的画面。"""
+        with self._lock:
+            self._frames[key] = frame
+            self._frames.move_to_end(key)
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+
+
+class ProxyBuilder:
+    """预览代理文件的生成线程：同一时间只运行一个生成，等待中的请求只保留最新的一个。
+
+    有新的请求或调用 stop 时结束正在运行的 ffmpeg，被结束的生成会删除自己的临时文件，
+    在文件列表中快速切换视频不会同时启动多个完整的转码。
+    """
+
+    def __init__(self, log=None):
+        self.log = log or print
+        self._condition = threading.Condition()
+        self._pending = None  # 等待生成的 PreviewSource
+        self._process = None  # 正在运行的 ffmpeg
+        self._cancelled = False  # 正在进行的生成已被取代或停止
+        self._stopped = False
+        self._thread = None
+
+    def request(self, source):
+        """请求生成 source 的代理文件，取代等待中和正在进行的生成。"""
+        with self._condition:
+            if self._stopped:
+                return
+            self._pending = source
+            self._cancel()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='vedit-proxy', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def stop(self):
+        """结束正在进行的生成并等待线程退出，之后不再接受请求。"""
+        with self._condition:
+            self._stopped = True
+            self._pending = None
+            self._cancel()
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _cancel(self):
+        """结束正在运行的 ffmpeg，调用方需持有锁。"""
+        self._cancelled = True
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+
+    def _started(self, process):
+        """run_ffmpeg 的 on_start：记录进程，生成在 ffmpeg 启动前已被取代时立即结束它。"""
+        with self._condition:
+            self._process = process
+            if self._cancelled:
+                process.kill()
+
+    def _run(self):
+        """线程执行函数。"""
+        while True:
+            with self._condition:
+                while self._pending is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                source, self._pending = self._pending, None
+                self._cancelled = False
+            try:
+                source.build_proxy(self._started)
+            except Exception as e:
+                if not self._cancelled:  # 被取代的生成不报告错误
+                    self.log(f"无法生成预览代理文件: {os.path.basename(source.video_path)}, 错误: {e}")
+            finally:
+                with self._condition:
+                    self._process = None
+
+
+class PreviewSource:
+    """一个视频的预览：按帧号解码并缓存画面，预先解码播放头附近的帧。
+
+    代理文件和缩略图条由 ProxyBuilder 在后台生成，生成之前直接从源文件解码并缩小到代理文件的分辨率，
+    选中视频后立即就能拖动预览；代理文件生成后改为从代理文件解码。
+    所有方法都可能启动 ffmpeg，应在后台线程中调用。
+    """
+    PREFETCH_BEHIND = 10  # 解码缺失画面时一并解码的播放头之前的帧数
+    PREFETCH_AHEAD = 30  # 预先解码的播放头之后的帧数
+
+    def __init__(self, video_path, frame_cache, proxy_builder, cache_folder=None, on_ready=None):
+        self.video_path = video_path
+        self.frame_cache = frame_cache
+        self.proxy_builder = proxy_builder
+        self.cache_folder = cache_folder or os.path.join(os.path.dirname(video_path), CACHE_FOLDER_NAME)
+        self.on_ready = on_ready  # on_ready(预览, 缩略图条路径)：代理文件和缩略图条生成后在生成线程中调用
+        self.path = None  # 当前解码的文件，代理文件生成前为源文件
+        self.info = None  # 当前解码的文件的参数，宽高为解码后的画面尺寸
+        self._proxy = None  # 生成线程完成后放入 (代理文件路径, 参数)，由预览线程切换
+        self._lock = threading.Lock()
+
+    def open(self):
+        """读取源文件参数并请求生成代理文件；代理文件已经生成时切换到代理文件，返回当前的参数。"""
+        if self.path is None:
+            info = probe_media(self.video_path)
+            height = min(ENCODER_PROFILES['proxy']['height'], info['height'])
+            width = max(round(info['width'] * height / info['height'] / 2) * 2, 2)  # 与代理文件的 scale=-2 一致
+            self.path, self.info = self.video_path, dict(info, width=width, height=height)
+            self.proxy_builder.request(self)
+        with self._lock:
+            if self._proxy is not None:
+                self.path, self.info = self._proxy
+                self._proxy = None
+        return self.info
+
+    def build_proxy(self, on_start=None):
+        """在生成线程中生成（或复用）代理文件和缩略图条，on_start 见 run_ffmpeg。"""
+        proxy_path = make_proxy(self.video_path, self.cache_folder, on_start=on_start)
+        info = probe_media(proxy_path)
+        with self._lock:
+            self._proxy = (proxy_path, info)
+        strip_path = make_thumbnail_strip(proxy_path, self.cache_folder, info['duration'], on_start=on_start)
+        if self.on_ready:
+            self.on_ready(self, strip_path)
+
+    def frame_index(self, t):
+        """把时间转换为当前解码的文件中的帧号。"""
+        last = max(int(self.info['duration'] * self.info['fps']) - 1, 0)
+        return min(max(int(t * self.info['fps']), 0), last)
+
+    def frame_at(self, t):
+        """返回 t 秒处的画面，不在缓存中时连同附近的帧一起解码。"""
+        self.open()
+        index = self.frame_index(t)
+        frame = self.frame_cache.get((self.path, index))
+        if frame is None:
+            self.decode_window(max(index - self.PREFETCH_BEHIND, 0), self.PREFETCH_BEHIND + self.PREFETCH_AHEAD)
+            frame = self.frame_cache.get((self.path, index))
+        return frame
+
+    def prefetch(self, t):
+        """预先解码 t 秒之后的帧，返回是否解码了新的帧（全部已缓存时返回 False）。"""
+        self.open()
+        first = self.frame_index(t)
+        last = self.frame_index(t + self.PREFETCH_AHEAD / self.info['fps'])
+        missing = next((i for i in range(first, last + 1) if (self.path, i) not in self.frame_cache), None)
+        if missing is None:
+            return False
+        self.decode_window(missing, self.PREFETCH_AHEAD)
+        return True
+
+    def decode_window(self, first, count):
+        """从第 first 帧开始解码 count 帧并放入缓存。"""
+        start_time = max(first - 0.5, 0) / self.info['fps']  # 定位到半帧之前，避免舍入误差跳过第 first 帧
+        frames = decode_frames(self.path, start_time, count, self.info['width'], self.info['height'])
+        for i, frame in enumerate(frames):
+            self.frame_cache.put((self.path, first + i), frame)
+
+
+class MediaIndex:
+    """文件夹级别的媒体元数据索引，保存在磁盘上，按路径、大小和修改时间判断是否需要重新探测。"""
+    INDEX_NAME = '.vedit_index.json'
+    VERSION = 2  # 第 2 版增加了 profile 和 level，旧索引需要重新探测
+
+    def __init__(self, folder, log=None):
+        self.folder = folder
+        self.path = os.path.join(folder, self.INDEX_NAME)
+        self.log = log  # 索引无法写回时（例如只读的源文件夹）输出日志
+        self.entries = {}
+        self._dirty = False
+        self.load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.save()
+
+    def load(self):
+        """从磁盘读取索引，文件不存在或已损坏时从空索引开始。"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if data.get('version') == self.VERSION:
+            self.entries = data.get('files', {})
+
+    def save(self):
+        """原子地写回索引，并清理已经不存在的文件。"""
+        if not self._dirty:
+            return
+        self.entries = {key: entry for key, entry in self.entries.items()
+                        if os.path.exists(os.path.join(self.folder, key))}
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.VERSION, 'files': self.entries}, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            # 索引只是缓存，写不回去时下次重新探测即可，不影响已经完成的处理
+            if self.log:
+                self.log(f"无法保存媒体索引: {self.path}, 错误: {e}")
+            return
+        self._dirty = False
+
+    def key(self, path):
+        """索引键：相对于索引所在文件夹的路径。"""
+        return os.path.relpath(os.path.abspath(path), os.path.abspath(self.folder))
+
+    def cached(self, path):
+        """返回索引中仍然有效的元数据，只检查文件大小和修改时间，不探测文件；没有或已过期时返回 None。"""
+        entry = self.entries.get(self.key(path))
+        stat = os.stat(path)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            return None
+        return entry
+
+    def get(self, path, keyframes=False):
+        """返回文件的元数据，文件有变化时才重新探测；keyframes 为真时同时返回关键帧列表。"""
+        key = self.key(path)
+        stat = os.stat(path)
+        entry = self.entries.get(key)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            entry = probe_media(path)
+            entry.update(size=stat.st_size, mtime=stat.st_mtime)
+            self.entries[key] = entry
+            self._dirty = True
+        if keyframes and 'keyframes' not in entry:
+            entry['keyframes'] = probe_keyframes(path)
+            self._dirty = True
+        return entry
+
+    def update(self, path, **fields):
+        """把额外计算出的字段（例如工作进程探测到的关键帧）写入已有条目。"""
+        entry = self.entries.get(self.key(path))
+        if entry is not None:
+            entry.update(fields)
+            self._dirty = True
+
+
+class JobJournal:
+    """剪辑作业的断点续传日志。
+
+    记录随机种子、每个源文件规划的片段边界和已完成的输出（大小、时长），每次更新都原子写入。
+    作业中断后重新运行时沿用同一种子和边界，只处理缺失或校验失败的片段；全部片段完成后删除日志。
+    """
+    VERSION = 1
+    DURATION_TOLERANCE = 0.5  # 已完成片段的时长与规划相差超过该值（秒）时视为损坏
+
+    def __init__(self, output_folder, key):
+        self.key = key
+        self.path = os.path.join(output_folder, f".vedit_journal_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}.json")
+        self.data = {'version': self.VERSION, 'key': key, 'seed': None, 'files': {}}
+        self.resumed = False
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == self.VERSION and data.get('key') == key:
+            self.data = data
+            self.resumed = True
+
+    def seed(self, default):
+        """返回作业的随机种子，第一次运行时记录 default。"""
+        if self.data['seed'] is None:
+            self.data['seed'] = default
+        return self.data['seed']
+
+    def entry(self, video_path, info):
+        """返回源文件的日志条目，源文件大小或修改时间变化时重新开始。"""
+        name = os.path.basename(video_path)
+        entry = self.data['files'].get(name)
+        if entry is None or entry['size'] != info['size'] or entry['mtime'] != info['mtime']:
+            entry = {'size': info['size'], 'mtime': info['mtime'], 'plan': None, 'completed': {}}
+            self.data['files'][name] = entry
+        return entry
+
+    def record_plan(self, video_path, plan):
+        """记录源文件规划的片段边界。"""
+        entry = self.data['files'][os.path.basename(video_path)]
+        entry['plan'] = [list(segment) for segment in plan]
+
+    def record_output(self, video_path, output):
+        """记录一个已完成的片段。"""
+        entry = self.data['files'][os.path.basename(video_path)]
+        entry['completed'][str(output['index'])] = {'name': output['name'], 'size': output['size'],
+                                                    'duration': output['duration']}
+
+    def pending(self, video_path, output_folder):
+        """返回尚未完成或校验失败的片段 [(序号, (起点, 终点)), ...]。"""
+        entry = self.data['files'][os.path.basename(video_path)]
+        pending = []
+        for i, (start_time, end_time) in enumerate(entry['plan']):
+            output = entry['completed'].get(str(i))
+            if output is not None:
+                try:
+                    size = os.path.getsize(os.path.join(output_folder, output['name']))
+                except OSError:
+                    size = None
+                if size == output['size'] and abs(output['duration'] - (end_time - start_time)) <= self.DURATION_TOLERANCE:
+                    continue
+            pending.append((i, (start_time, end_time)))
+        return pending
+
+    def complete(self, video_paths, output_folder):
+        """video_paths 的片段是否都已规划、完成并通过校验。"""
+        return all(self.data['files'].get(os.path.basename(video_path), {}).get('plan') is not None
+                   and not self.pending(video_path, output_folder) for video_path in video_paths)
+
+    def save(self):
+        """原子地写入日志。"""
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+    def remove(self):
+        """删除日志，之后用相同参数运行时作为新的作业重新剪辑。"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def contiguous_runs(segments):
+    """把 [(序号, 片段), ...] 按序号连续的部分分组。"""
+    runs = []
+    for item in segments:
+        if runs and item[0] == runs[-1][-1][0] + 1:
+            runs[-1].append(item)
+        else:
+            runs.append([item])
+    return runs
+
+
+class VideoEngine:
+    """视频处理引擎：剪辑、拼接和片头拼接，通过回调输出日志、进度和结构化事件。"""
+    SEGMENTS_PER_TASK = 8  # 精确剪辑时每个进程任务处理的片段数
+    EVENTS_LOG_NAME = '.vedit_events.jsonl'  # 默认的事件日志文件名，写在各阶段的输出文件夹中
+
+    def __init__(self, log=None, progress=None, frame_exact=False, workers=0, seed=None, transition_duration=0,
+                 events=None, events_path=None, profiles=None, watermark=None, segment_mode='random',
+                 scene_threshold=SCENE_THRESHOLD):
+        self.log = log or print
+        self.progress = progress
+        self.instrumentation = Instrumentation(callback=events)
+        self.events_path = events_path  # 事件日志路径，None 表示写到各阶段的输出文件夹
+        self._last_percent = -1
+        self.frame_exact = frame_exact  # 精确剪辑：逐帧切分并重新编码，默认按关键帧流复制
+        self.workers = workers  # 并行进程/线程数，0 表示按 CPU 核数和可用内存自动决定
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)  # 片段边界的随机种子
+        self.transition_duration = transition_duration  # 拼接转场时长（秒），0 表示不加转场，可直接流复制拼接
+        self.profiles = resolve_profiles(profiles)  # 各阶段（clip、concat、header、watermark）使用的编码档位
+        self.watermark = watermark  # 拼接、片头和字幕输出在同一次编码中叠加的水印，None 表示不加
+        if segment_mode not in SEGMENT_MODES:
+            raise ValueError(f"未知的切分方式: {segment_mode}")
+        self.segment_mode = segment_mode  # 'random' 随机切分，'scene' 优先在镜头切换处切分
+        self.scene_threshold = scene_threshold
+        self._is_paused = False  # 暂停标志
+
+    def log_message(self, message):
+        """输出日志信息。"""
+        self.log(message)
+
+    def report_progress(self, value):
+        """输出 0~100 的进度，数值不变时不重复输出。"""
+        if self.progress and value != self._last_percent:
+            self._last_percent = value
+            self.progress(value)
+
+    def add_frames(self, frames):
+        """累计已处理帧数，并按帧数更新进度。"""
+        percent, _ = self.instrumentation.add_frames(frames)
+        self.report_progress(percent)
+
+    def stage(self, name, folder, total_frames):
+        """开始一个处理阶段，事件写入 events_path 或该阶段输出文件夹中的事件日志。"""
+        self._last_percent = -1
+        self.report_progress(0)
+        return self.instrumentation.stage(name, total_frames,
+                                          self.events_path or os.path.join(folder, self.EVENTS_LOG_NAME))
+
+    def pause(self):
+        """请求暂停：正在执行的任务完成后不再开始新的任务。"""
+        self._is_paused = True
+
+    def resume(self):
+        """清除暂停标志。"""
+        self._is_paused = False
+
+    def clip_videos(self, clip_folder, output_folder):
+        """将文件夹中的视频剪辑成3~5秒的片段，源文件（或大文件中的片段区间）在进程池中并行处理。
+
+        进度记录在输出文件夹的作业日志中，中断后重新运行只处理缺失的片段。
+        """
+        video_paths = [os.path.join(clip_folder, file_name) for file_name in sorted(os.listdir(clip_folder))
+                       if file_name.lower().endswith(('.mp4', '.avi', '.mov'))]
+        journal_key = (f"clip|{os.path.abspath(clip_folder)}|{os.path.abspath(output_folder)}|"
+                       f"{'exact' if self.frame_exact else 'keyframe'}")
+        if self.segment_mode == 'scene':
+            journal_key += f"|scene:{self.scene_threshold}"
+        journal = JobJournal(output_folder, journal_key)
+        self.seed = journal.seed(self.seed)
+        if journal.resumed:
+            self.log_message("发现未完成的作业日志，只处理缺失的片段。")
+        self.remove_partial_files(output_folder, video_paths)
+        workers = max_clip_workers(self.frame_exact, self.workers)
+        threads = encoder_threads(workers, self.workers)  # 每个进程的编码线程数，合计不超过可用核数
+
+        with MediaIndex(clip_folder, self.log_message) as index:
+            tasks = []
+            fps = {}
+            total_frames = 0
+            sources = []
+            for video_path in video_paths:
+                try:
+                    sources.append((video_path, index.get(video_path)))  # 从索引读取时长，不再打开视频
+                except Exception as e:
+                    self.log_message(f"无法处理视频文件: {os.path.basename(video_path)}, 错误: {e}")
+
+            scene_cuts = {}
+            if self.segment_mode == 'scene':  # 只分析还没有规划片段边界的源文件
+                scene_cuts = self.detect_scenes(output_folder, [(video_path, info) for video_path, info in sources
+                                                              if journal.entry(video_path, info)['plan'] is None])
+
+            for video_path, info in sources:
+                # 每个文件使用独立的随机种子，片段边界与进程数、完成顺序无关
+                seed = f"{self.seed}:{os.path.basename(video_path)}"
+                fps[video_path] = info['fps']
+                entry = journal.entry(video_path, info)
+                if entry['plan'] is None and self.frame_exact:
+                    journal.record_plan(video_path, plan_segments(int(info['duration']), rng=random.Random(seed),
+                                                                  scene_cuts=scene_cuts.get(video_path)))
+
+                if entry['plan'] is None:
+                    total_frames += info['duration'] * info['fps']
+                    tasks.append((split_by_keyframes, video_path, output_folder, info, seed, scene_cuts.get(video_path),
+                                  threads))
+                    continue
+
+                missing = journal.pending(video_path, output_folder)
+                total_frames += sum(end_time - start_time for _, (start_time, end_time) in missing) * info['fps']
+                if self.frame_exact:
+                    for i in range(0, len(missing), self.SEGMENTS_PER_TASK):  # 大文件按片段区间拆分给多个进程
+                        tasks.append((write_segments, video_path, output_folder, missing[i:i + self.SEGMENTS_PER_TASK],
+                                      self.profiles['clip'], threads))
+                else:
+                    # 关键帧模式只补切缺失的连续区间；整个文件都还没切出时允许按分段器的实际结果重新规划，
+                    # 否则分段器与规划的差异会在每次续传时重复出现
+                    replan = len(missing) == len(entry['plan'])
+                    for run in contiguous_runs(missing):
+                        tasks.append((split_segments, video_path, output_folder, run, info.get('keyframes'),
+                                      info['duration'], threads, replan))
+            journal.save()
+
+            self.log_message(f"使用 {workers} 个进程剪辑 {len(fps)} 个视频文件，待处理任务 {len(tasks)} 个")
+
+            context = multiprocessing.get_context('spawn')  # 不 fork 带有 Qt 状态的主进程
+            with self.stage('clip', output_folder, total_frames), context.Manager() as manager:
+                messages = manager.Queue()
+                with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                    pending = {executor.submit(run_timed_task, func, *args, messages): args[0] for func, *args in tasks}
+                    while pending:
+                        if self._is_paused:  # 检查暂停标志，尚未开始的任务不再执行
+                            for future in pending:
+                                future.cancel()
+
+                        self.instrumentation.queue_depth = len(pending)
+                        done, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                        self.drain_messages(messages, journal, index, fps)
+                        for future in done:
+                            video_path = pending.pop(future)
+                            try:
+                                future.result()
+                            except CancelledError:
+                                continue
+                            except Exception as e:
+                                self.log_message(f"无法剪辑视频文件: {os.path.basename(video_path)}, 错误: {e}")
+
+                self.drain_messages(messages, journal, index, fps)
+
+            if not self._is_paused and journal.complete([video_path for video_path, _ in sources], output_folder):
+                journal.remove()  # 全部片段都已完成，不再保留续传日志
+
+    def detect_scenes(self, output_folder, sources):
+        """并行分析源文件的镜头切换，返回 {源文件: 镜头切换时间列表}，分析失败的文件改用随机切分。
+
+        分析结果缓存在输出文件夹中，源文件夹可以是只读的。
+        """
+        if not sources:
+            return {}
+        self.log_message(f"正在分析镜头切换: {len(sources)} 个视频文件")  # 添加调试信息
+        cache_folder = os.path.join(output_folder, CACHE_FOLDER_NAME)
+        scene_cuts = {}
+        total_frames = sum(info['duration'] * info['fps'] for _, info in sources)
+        with self.stage('scenes', output_folder, total_frames), \
+                ThreadPoolExecutor(max_workers=max_clip_workers(False, self.workers)) as executor:
+            futures = {executor.submit(analyze_scenes, video_path, cache_folder, self.add_frames): (video_path, info)
+                       for video_path, info in sources}
+            for future in as_completed(futures):
+                video_path, info = futures[future]
+                try:
+                    scene_cuts[video_path] = scene_cut_times(future.result(), info['fps'], self.scene_threshold)
+                except Exception as e:
+                    self.log_message(f"无法分析镜头切换: {os.path.basename(video_path)}, 错误: {e}")
+        return scene_cuts
+
+    def drain_messages(self, messages, journal, index, fps):
+        """处理工作进程发来的消息：转发日志，把规划和完成的片段写入作业日志，按片段帧数更新进度。"""
+        changed = False
+        while True:
+            try:
+                kind, payload = messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'log':
+                self.log_message(payload)
+            elif kind == 'keyframes':
+                index.update(payload['video'], keyframes=payload['keyframes'])
+            elif kind == 'plan':
+                journal.record_plan(payload['video'], payload['plan'])
+                changed = True
+            elif kind == 'clip':
+                journal.record_output(payload['video'], payload)
+                self.add_frames(payload['duration'] * fps[payload['video']])
+                changed = True
+            elif kind == 'task':
+                self.instrumentation.file_done(payload['video'], payload['elapsed'],
+                                               payload['duration'] * fps[payload['video']], payload['bytes'])
+        if changed:
+            journal.save()
+
+    def remove_partial_files(self, output_folder, video_paths):
+        """删除上次中断时留下的临时片段文件。"""
+        base_names = [os.path.splitext(os.path.basename(video_path))[0] for video_path in video_paths]
+        for file_name in os.listdir(output_folder):
+            if file_name.startswith(('.seg_', '.part_')) and any(f"_{base_name}_" in file_name for base_name in base_names):
+                os.remove(os.path.join(output_folder, file_name))
+
+    def select_segments(self, output_folder, concat_time, variants=1):
+        """从剪辑后的片段中随机选取 variants 组互不相同的片段，每组总时长（扣除转场重叠）正好等于 concat_time。
+
+        片段时长优先从元数据索引读取，索引中没有时从文件名估计，只有被选中的片段才会被探测；
+        返回 ([[(片段路径, 使用时长), ...], ...], {片段路径: 元数据})，没有可用片段时返回 ([], {})。
+        """
+        durations = {}
+        estimated = set()
+        infos = {}
+        rng = random.Random(f"{self.seed}:{concat_time}")
+        with MediaIndex(output_folder) as index:
+            for file_name in os.listdir(output_folder):
+                if not SEGMENT_NAME_PATTERN.match(file_name):
+                    continue
+                clip_path = os.path.join(output_folder, file_name)
+                try:
+                    info = index.cached(clip_path)
+                    if info is not None:
+                        infos[clip_path] = info
+                        durations[clip_path] = info['duration']
+                    elif segment_name_duration(file_name) is not None:
+                        durations[clip_path] = segment_name_duration(file_name)
+                        estimated.add(clip_path)
+                    else:
+                        infos[clip_path] = index.get(clip_path)
+                        durations[clip_path] = infos[clip_path]['duration']
+                except Exception as e:
+                    self.log_message(f"无法处理视频文件: {file_name}, 错误: {e}")
+
+            selections = []
+            seen = set()
+            for _ in range(variants * 10):  # 片段池太小时可能凑不出足够多的不同组合
+                if len(selections) >= variants:
+                    break
+                while True:
+                    # 过短的片段放不下首尾两段转场
+                    segments = sorted((clip_path, duration) for clip_path, duration in durations.items()
+                                      if duration > 2 * self.transition_duration)
+                    selected = choose_segments(segments, concat_time, self.transition_duration, rng)
+                    unprobed = [clip_path for clip_path, _ in selected if clip_path in estimated]
+                    if not unprobed:
+                        break
+                    # 文件名中的时长只是估计，探测选中的片段后按实际时长重新选取
+                    for clip_path in unprobed:
+                        estimated.discard(clip_path)
+                        try:
+                            infos[clip_path] = index.get(clip_path)
+                            durations[clip_path] = infos[clip_path]['duration']
+                        except Exception as e:
+                            self.log_message(f"无法处理视频文件: {os.path.basename(clip_path)}, 错误: {e}")
+                            del durations[clip_path]
+                if not selected:
+                    break
+                key = tuple(clip_path for clip_path, _ in selected)
+                if key not in seen:
+                    seen.add(key)
+                    selections.append(selected)
+
+        if not selections:
+            self.log_message("没有找到可拼接的片段。")
+            return [], {}
+        if len(selections) < variants:
+            self.log_message(f"片段不足，只能生成 {len(selections)} 个不同的版本")
+        return selections, infos
+
+    def concat_videos(self, output_folder, concat_time, variants=1):
+        """将剪辑后的片段拼接成指定长度的视频，并添加随机转场效果。
+
+        与 render 使用同一种不带片头和音乐的渲染计划：编码参数一致且没有转场和水印时流复制，
+        否则转场和水印在同一个 ffmpeg 滤镜图中完成，只编码一次。
+        variants 大于 1 时从同一批片段生成多个不同的版本，保存为 final_output_001.mp4 等。
+        """
+        selections, infos = self.select_segments(output_folder, concat_time, variants)
+        if not selections:
+            return
+
+        plans = [RenderPlan(selected, infos, None, None, self.watermark, None, self.transition_duration,
+                            self.profiles['concat']) for selected in selections]
+        total_frames = sum(plan.duration * plan.target['fps'] for plan in plans)
+        with self.stage('concat', output_folder, total_frames) as instrumentation:
+            for i, plan in enumerate(plans):
+                if self._is_paused:
+                    break
+                self.render_plan(output_folder, variant_name("final_output.mp4", i, len(plans)), plan,
+                                 instrumentation)
+
+    def mix_audio(self, video_folder, music_file='', voice_file='', volume=0.3, prefix=''):
+        """为文件夹中的视频批量添加背景音乐和配音，结果保存为 music_<原文件名>.mp4。
+
+        音乐和配音只解码一次并缓存，每个视频按块混音后通过管道交给 ffmpeg，视频轨流复制不重新编码；
+        只处理文件名以 prefix 开头的视频。
+        """
+        cache_folder = os.path.join(video_folder, CACHE_FOLDER_NAME)
+        try:
+            music = decode_audio(music_file, cache_folder) if music_file else None
+            voice = decode_audio(voice_file, cache_folder) if voice_file else None
+        except Exception as e:
+            self.log_message(f"无法读取音频文件, 错误: {e}")
+            return
+        if music is None and voice is None:
+            self.log_message("请选择背景音乐或配音文件。")
+            return
+
+        videos = []
+        with MediaIndex(video_folder) as index:
+            for file_name in sorted(os.listdir(video_folder)):
+                if (not file_name.lower().endswith(('.mp4', '.avi', '.mov')) or file_name.startswith('music_')
+                        or not file_name.startswith(prefix)):
+                    continue
+                video_path = os.path.join(video_folder, file_name)
+                try:
+                    videos.append((video_path, index.get(video_path)))
+                except Exception as e:
+                    self.log_message(f"无法处理视频文件: {file_name}, 错误: {e}")
+
+        total_frames = sum(info['duration'] * info['fps'] for _, info in videos)
+        with self.stage('audio', video_folder, total_frames), \
+                ThreadPoolExecutor(max_workers=max_clip_workers(False, self.workers)) as executor:
+            futures = {executor.submit(self.mix_audio_into, video_path, info, music, voice, volume):
+                       output_name('music_', video_path) for video_path, info in videos}
+            self.instrumentation.queue_depth = len(futures)
+            for future in as_completed(futures):
+                self.instrumentation.queue_depth -= 1
+                if self._is_paused:  # 检查暂停标志，取消尚未开始的混音
+                    for pending in futures:
+                        pending.cancel()
+                try:
+                    future.result()
+                    self.log_message(f"已生成视频: {futures[future]}")  # 添加调试信息
+                except CancelledError:
+                    continue
+                except Exception as e:
+                    self.log_message(f"无法生成视频: {futures[future]}, 错误: {e}")
+
+    def mix_audio_into(self, video_path, info, music, voice, volume):
+        """为一个视频混音并封装，按已写入的音频时长更新进度。"""
+        output_path = os.path.join(os.path.dirname(video_path), output_name('music_', video_path))
+        start = time.perf_counter()
+
+        def chunks():
+            for chunk in mix_audio_chunks(info['duration'], music, voice, volume):
+                yield chunk
+                self.add_frames(len(chunk) / AUDIO_SAMPLE_RATE * info['fps'])
+
+        mux_audio(video_path, output_path, chunks(), keep_original=bool(info['audio_codec']))
+        self.instrumentation.file_done(output_path, time.perf_counter() - start, info['duration'] * info['fps'],
+                                       os.path.getsize(output_path))
+
+    def watermark_videos(self, video_folder, watermark, prefix=''):
+        """为文件夹中的视频批量添加水印，结果保存为 watermark_<原文件名>.mp4。
+
+        每个视频用 ffmpeg overlay 只编码一次，音轨流复制，多个视频并行处理；只处理文件名以 prefix 开头的视频。
+        """
+        videos = []
+        with MediaIndex(video_folder) as index:
+            for file_name in sorted(os.listdir(video_folder)):
+                if (not file_name.lower().endswith(('.mp4', '.avi', '.mov')) or file_name.startswith('watermark_')
+                        or not file_name.startswith(prefix)):
+                    continue
+                video_path = os.path.join(video_folder, file_name)
+                try:
+                    videos.append((video_path, index.get(video_path)))
+                except Exception as e:
+                    self.log_message(f"无法处理视频文件: {file_name}, 错误: {e}")
+
+        workers = max_clip_workers(True, self.workers)
+        threads = encoder_threads(workers, self.workers)
+        total_frames = sum(info['duration'] * info['fps'] for _, info in videos)
+        with self.stage('watermark', video_folder, total_frames), ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.watermark_video, video_path, info, watermark, threads):
+                       output_name('watermark_', video_path) for video_path, info in videos}
+            self.instrumentation.queue_depth = len(futures)
+            for future in as_completed(futures):
+                self.instrumentation.queue_depth -= 1
+                if self._is_paused:  # 检查暂停标志，取消尚未开始的任务
+                    for pending in futures:
+                        pending.cancel()
+                try:
+                    future.result()
+                    self.log_message(f"已生成视频: {futures[future]}")  # 添加调试信息
+                except CancelledError:
+                    continue
+                except Exception as e:
+                    self.log_message(f"无法生成视频: {futures[future]}, 错误: {e}")
+
+    def watermark_video(self, video_path, info, watermark, threads):
+        """用 ffmpeg overlay 为一个视频加水印。"""
+        output_path = os.path.join(os.path.dirname(video_path), output_name('watermark_', video_path))
+        width, height = info['width'], info['height']
+        profile = self.profiles['watermark']
+        video_filter = f"[0:v][1:v]{watermark.overlay_filter(width, height)}"
+        if profile_scale_filter(profile):
+            video_filter += f",{profile_scale_filter(profile)}"  # 先按原分辨率叠加水印，再按档位缩小
+        start = time.perf_counter()
+        counted = [0]
+
+        def on_frames(frames):
+            counted[0] += frames
+            self.add_frames(frames)
+
+        temp_path = output_path + '.part'
+        run_ffmpeg(['-i', video_path, '-i', watermark.png_path(width, height),
+                    '-filter_complex', video_filter + '[v]', '-map', '[v]', '-map', '0:a?']
+                   + profile_ffmpeg_args(profile, threads, copy_audio=True) + ['-f', 'mp4', temp_path], on_frames)
+        os.replace(temp_path, output_path)
+        self.instrumentation.file_done(output_path, time.perf_counter() - start, counted[0],
+                                       os.path.getsize(output_path))
+
+    def render(self, output_folder, concat_time, header_file='', music_file='', voice_file='', volume=0.3,
+               variants=1):
+        """一次渲染成片：拼接、片头、水印和背景音乐合并为一个渲染计划，只解码、编码、写入一次。
+
+        有片头时输出 final_final_output.mp4，否则输出 final_output.mp4；能流复制时不重新编码。
+        variants 大于 1 时从同一批片段生成多个不同的版本，文件名加上序号。
+        """
+        selections, infos = self.select_segments(output_folder, concat_time, variants)
+        if not selections:
+            return
+        header_info = None
+        if header_file:
+            try:
+                with MediaIndex(output_folder) as index:
+                    header_info = index.get(header_file)
+            except Exception as e:
+                self.log_message(f"无法读取片头文件: {header_file}, 错误: {e}")
+                return
+
+        plans = [RenderPlan(selected, infos, header_file or None, header_info, self.watermark, None,
+                            self.transition_duration, self.profiles['concat']) for selected in selections]
+        total_frames = sum(plan.duration * plan.target['fps'] for plan in plans)
+        with self.stage('render', output_folder, total_frames) as instrumentation:
+            for i, plan in enumerate(plans):
+                if self._is_paused:
+                    break
+                final_video_name = variant_name("final_final_output.mp4" if header_file else "final_output.mp4",
+                                                i, len(plans))
+                self.render_plan(output_folder, final_video_name, plan, instrumentation, music_file, voice_file,
+                                 volume)
+
+    def render_plan(self, output_folder, final_video_name, plan, instrumentation, music_file='', voice_file='',
+                    volume=0.3):
+        """按渲染计划生成 final_video_name，中间文件在结束后删除。"""
+        final_video_path = os.path.join(output_folder, final_video_name)
+        temp_path = os.path.join(output_folder, f".part_{final_video_name}")
+        list_path = os.path.join(output_folder, f".{final_video_name}.concat.txt")
+        audio_path = os.path.join(output_folder, f".{final_video_name}.mix.f32")
+        cache_folder = os.path.join(output_folder, CACHE_FOLDER_NAME)
+        threads = encoder_threads(1, self.workers)  # 每个成片只有一个编码器，使用全部可用核数
+        start = time.perf_counter()
+        start_frames = instrumentation.done_frames
+        try:
+            copied = False
+            if plan.can_stream_copy() and not (music_file or voice_file):
+                try:
+                    copy_inputs = plan.copy_inputs(cache_folder, threads)
+                    if copy_inputs is not None:
+                        paths, outpoints = copy_inputs
+                        self.log_message(f"正在流复制生成最终视频: {final_video_name}，共 {len(paths)} 个文件")
+                        concat_by_stream_copy(paths, temp_path, self.add_frames, outpoints)
+                        copied = True
+                except Exception as e:
+                    # 片头无法预转码或流复制失败时改为一次编码，只损失速度
+                    self.log_message(f"无法流复制生成最终视频: {final_video_name}, 错误: {e}，改为重新编码")
+            if not copied:
+                if music_file or voice_file:
+                    self.write_audio_mix(audio_path, plan.duration, cache_folder, music_file, voice_file, volume)
+                    plan.audio_path = audio_path
+                self.log_message(f"正在一次编码生成最终视频: {final_video_name}，共 {len(plan.segments)} 个片段")
+                run_ffmpeg(plan.ffmpeg_args(temp_path, list_path, threads), self.add_frames)
+            os.replace(temp_path, final_video_path)
+            instrumentation.file_done(final_video_path, time.perf_counter() - start,
+                                      instrumentation.done_frames - start_frames, os.path.getsize(final_video_path))
+            self.log_message("生成最终视频完成！")
+        except Exception as e:
+            self.log_message(f"无法生成最终视频: {final_video_name}, 错误: {e}")
+        finally:
+            for path in (temp_path, list_path, audio_path):  # 不保留无法复用的中间文件
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def write_audio_mix(self, audio_path, duration, cache_folder, music_file='', voice_file='', volume=0.3):
+        """把背景音乐和配音按成片时长预混为 f32le 双声道文件。"""
+        music = decode_audio(music_file, cache_folder) if music_file else None
+        voice = decode_audio(voice_file, cache_folder) if voice_file else None
+        with open(audio_path, 'wb') as f:
+            for chunk in mix_audio_chunks(duration, music, voice, volume):
+                f.write(chunk.tobytes())
+
+    def burn_subtitles(self, video_folder, renderer, prefix=''):
+        """为文件夹中有同名 .srt/.ass 字幕的视频批量烧录字幕，结果保存为 subtitle_<原文件名>.mp4。
+
+        解码后的帧通过管道直接交给编码器，只在字幕出现的帧上叠加缓存的字幕图像，音轨流复制；
+        设置了水印时在同一次编码中一并叠加。多个视频并行处理，只处理文件名以 prefix 开头的视频。
+        """
+        videos = []
+        with MediaIndex(video_folder) as index:
+            for file_name in sorted(os.listdir(video_folder)):
+                if (not file_name.lower().endswith(('.mp4', '.avi', '.mov')) or file_name.startswith('subtitle_')
+                        or not file_name.startswith(prefix)):
+                    continue
+                video_path = os.path.join(video_folder, file_name)
+                subtitle_path = find_subtitle_file(video_path)
+                if subtitle_path is None:
+                    self.log_message(f"没有找到字幕文件: {file_name}")  # 添加调试信息
+                    continue
+                try:
+                    videos.append((video_path, subtitle_path, index.get(video_path)))
+                except Exception as e:
+                    self.log_message(f"无法处理视频文件: {file_name}, 错误: {e}")
+
+        workers = max_clip_workers(True, self.workers)
+        threads = encoder_threads(workers, self.workers)
+        total_frames = sum(info['duration'] * info['fps'] for _, _, info in videos)
+        with self.stage('subtitle', video_folder, total_frames), ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.burn_subtitle, video_path, subtitle_path, info, renderer, threads):
+                       output_name('subtitle_', video_path) for video_path, subtitle_path, info in videos}
+            self.instrumentation.queue_depth = len(futures)
+            for future in as_completed(futures):
+                self.instrumentation.queue_depth -= 1
+                if self._is_paused:  # 检查暂停标志，取消尚未开始的任务
+                    for pending in futures:
+                        pending.cancel()
+                try:
+                    future.result()
+                    self.log_message(f"已生成视频: {futures[future]}")  # 添加调试信息
+                except CancelledError:
+                    continue
+                except Exception as e:
+                    self.log_message(f"无法生成视频: {futures[future]}, 错误: {e}")
+
+    def burn_subtitle(self, video_path, subtitle_path, info, renderer, threads):
+        """把一个视频解码为 rgb24 帧，叠加字幕后通过管道重新编码。"""
+        output_path = os.path.join(os.path.dirname(video_path), output_name('subtitle_', video_path))
+        width, height, fps = info['width'], info['height'], info['fps']
+        cues = load_subtitles(subtitle_path)
+        profile = self.profiles['subtitle']
+        args = ['-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f"{width}x{height}",
+                '-framerate', str(Fraction(fps).limit_denominator(1001)), '-i', 'pipe:0',
+                '-i', video_path, '-map', '0:v:0', '-map', '1:a?']
+        if profile_scale_filter(profile):
+            args += ['-vf', profile_scale_filter(profile)]
+        temp_path = output_path + '.part'
+        args += profile_ffmpeg_args(profile, threads, copy_audio=True) + ['-f', 'mp4', temp_path]
+
+        start = time.perf_counter()
+        counted = [0]
+
+        def on_frame():
+            counted[0] += 1
+            self.add_frames(1)
+
+        decoder = subprocess.Popen([FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error', '-i', video_path,
+                                    '-map', '0:v:0', '-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:1'],
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            frames = read_frames(decoder.stdout, width, height)
+            pipe_to_ffmpeg(args, subtitle_frames(frames, fps, cues, renderer, self.watermark, on_frame))
+        finally:
+            decoder.stdout.close()
+            if decoder.poll() is None:
+                decoder.kill()
+            decoder.wait()
+        if decoder.returncode != 0 or counted[0] == 0:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)  # 解码中途失败时编码器写出的是不完整的视频
+            raise RuntimeError("无法解码视频画面")
+        os.replace(temp_path, output_path)
+        self.instrumentation.file_done(output_path, time.perf_counter() - start, counted[0],
+                                       os.path.getsize(output_path))
+
+    def concat_header(self, header_file, output_folder):
+        """将片头与文件夹中的视频拼接。
+
+        片头按目标视频的编码参数预先转码一次并缓存，之后以流复制的方式并行拼接到每个视频前；
+        编码无法匹配的视频才退回逐个重新编码。
+        """
+        groups = {}
+        frames = {}
+        with MediaIndex(output_folder) as index:
+            try:
+                header_info = index.get(header_file)
+            except Exception as e:
+                self.log_message(f"无法读取片头文件: {header_file}, 错误: {e}")
+                return
+            for file_name in sorted(os.listdir(output_folder)):
+                if file_name.startswith('final_'):
+                    video_path = os.path.join(output_folder, file_name)
+                    try:
+                        info = index.get(video_path)  # 通过索引预先排除无法读取的视频
+                    except Exception as e:
+                        self.log_message(f"无法处理视频文件: {file_name}, 错误: {e}")
+                        continue
+                    groups.setdefault(media_signature(info), (info, []))[1].append(video_path)
+                    frames[video_path] = (header_info['duration'] + info['duration']) * info['fps']
+
+        # 每组编码参数只转码一次片头
+        copy_jobs = []
+        fallback_paths = []
+        cache_folder = os.path.join(output_folder, CACHE_FOLDER_NAME)
+        for target, video_paths in groups.values():
+            if self.watermark is not None:
+                fallback_paths.extend(video_paths)  # 加水印必须重新编码，片头和水印在同一次编码中完成
+                continue
+            try:
+                normalized_header = normalize_header(header_file, header_info, target, cache_folder,
+                                                     self.profiles['header'], encoder_threads(1, self.workers))
+            except Exception as e:
+                self.log_message(f"无法预转码片头, 错误: {e}")
+                normalized_header = None
+            if normalized_header is None:
+                fallback_paths.extend(video_paths)
+            else:
+                copy_jobs.extend((normalized_header, video_path) for video_path in video_paths)
+
+        with self.stage('header', output_folder, sum(frames.values())):
+            self.prepend_header_by_stream_copy(copy_jobs, output_folder)
+            if fallback_paths:
+                self.prepend_header_by_encoding(header_file, fallback_paths, output_folder)
+
+    def prepend_header_by_stream_copy(self, copy_jobs, output_folder):
+        """在线程池中并行地把预转码的片头流复制拼接到各个视频前。"""
+        def prepend(normalized_header, video_path, final_clip_path):
+            start = time.perf_counter()
+            counted = [0]
+
+            def on_frames(frames):
+                counted[0] += frames
+                self.add_frames(frames)
+
+            # 先写临时文件，成功后再改名，中断时不留下不完整的成片
+            temp_path = os.path.join(output_folder, f".part_{os.path.basename(final_clip_path)}")
+            try:
+                concat_by_stream_copy([normalized_header, video_path], temp_path, on_frames)
+                os.replace(temp_path, final_clip_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            self.instrumentation.file_done(final_clip_path, time.perf_counter() - start, counted[0],
+                                           os.path.getsize(final_clip_path))
+
+        with ThreadPoolExecutor(max_workers=max_clip_workers(False, self.workers)) as executor:
+            futures = {}
+            for normalized_header, video_path in copy_jobs:
+                final_clip_path = os.path.join(output_folder, f"final_{os.path.basename(video_path)}")
+                future = executor.submit(prepend, normalized_header, video_path, final_clip_path)
+                futures[future] = os.path.basename(final_clip_path)
+            self.instrumentation.queue_depth = len(futures)
+            for future in as_completed(futures):
+                self.instrumentation.queue_depth -= 1
+                if self._is_paused:  # 检查暂停标志，取消尚未开始的拼接
+                    for pending in futures:
+                        pending.cancel()
+                try:
+                    future.result()
+                    self.log_message(f"已生成最终视频: {futures[future]}")  # 添加调试信息
+                except CancelledError:
+                    continue
+                except Exception as e:
+                    self.log_message(f"无法生成最终视频: {futures[future]}, 错误: {e}")
+
+    def prepend_header_by_encoding(self, header_file, video_paths, output_folder):
+        """编码参数无法匹配的视频：逐个与片头一起重新编码。"""
+        # 片头在整个批次中只打开一次，每个视频处理完立即关闭，不累积 ffmpeg 读取进程
+        mpe = load_moviepy()
+        threads = encoder_threads(1, self.workers)  # 逐个编码，每次使用全部可用核数
+        header_clip = mpe.VideoFileClip(header_file)
+        try:
+            for video_path in video_paths:
+                if self._is_paused:  # 检查暂停标志
+                    break
+                final_clip_name = f"final_{os.path.basename(video_path)}"
+                final_clip_path = os.path.join(output_folder, final_clip_name)
+                temp_path = os.path.join(output_folder, f".part_{final_clip_name}")
+                video_clip = None
+                try:
+                    video_clip = mpe.VideoFileClip(video_path)
+                    final_clip = mpe.concatenate_videoclips([header_clip, video_clip])
+                    if self.watermark is not None:
+                        final_clip = self.watermark.apply(final_clip)
+                    final_clip = apply_profile(final_clip, self.profiles['header'])
+                    self.log_message(f"正在生成最终视频: {final_clip_name}")  # 添加调试信息
+                    start = time.perf_counter()
+                    logger = frame_logger(self.add_frames)
+                    final_clip.write_videofile(temp_path, logger=logger,
+                                               **profile_write_kwargs(self.profiles['header'], threads))
+                    os.replace(temp_path, final_clip_path)
+                    self.instrumentation.file_done(final_clip_path, time.perf_counter() - start,
+                                                   logger.last_index + 1, os.path.getsize(final_clip_path))
+                except Exception as e:
+                    self.log_message(f"无法生成最终视频: {final_clip_name}, 错误: {e}")
+                finally:
+                    if video_clip is not None:
+                        video_clip.close()
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+        finally:
+            header_clip.close()
+
+
+JOB_OPERATIONS = ('clip', 'concat', 'header', 'audio', 'watermark', 'subtitle')
+# 调度器中作业的状态及界面显示的名称
+JOB_STATES = {'queued': '排队中', 'held': '暂停排队', 'running': '运行中', 'paused': '已暂停', 'done': '已完成',
+              'failed': '失败', 'cancelled': '已取消'}
+PARTIAL_PREFIXES = ('.part_', '.seg_')  # 未完成的输出和剪辑临时文件
+PARTIAL_SUFFIXES = ('.part', '.part.png', '.concat.txt', '.mix.f32', '.tmp')
+SUSPEND_SUPPORTED = hasattr(signal, 'SIGSTOP')  # Windows 上不能挂起正在运行的作业
+
+
+def parse_concat_time(value):
+    """把拼接时间转换为秒，支持秒数或界面使用的 '分钟-秒' 格式，格式无效时抛出 ValueError。"""
+    if isinstance(value, (int, float)):
+        return value
+    text = str(value).strip()
+    if '-' in text:
+        minutes, seconds = map(int, text.split('-'))
+        return minutes * 60 + seconds
+    return float(text)
+
+
+def run_job(job, log=None, progress=None, workers=0, events=None):
+    """执行任务清单中的一个作业，按 operations 的顺序依次剪辑、拼接、拼接片头。
+
+    作业字段：source（源文件夹）、output（输出文件夹，默认与源文件夹相同）、operations、
+    concat_time、header，以及可选的 frame_exact、transition、workers、seed、events（事件日志路径）、
+    profiles（各阶段的编码档位，如 {"clip": "lossless", "concat": "draft"}）。
+    audio 操作为输出文件夹中的 final_* 视频添加背景音乐，使用 music、voice 和 music_volume（0~1，默认 0.3）。
+    给出 watermark（图片）、watermark_position 和 watermark_size 时：operations 中有 watermark 操作则单独为
+    final_* 视频加水印，否则在拼接、片头和字幕的同一次编码中叠加水印。
+    subtitle 操作为有同名 .srt/.ass 字幕的 final_* 视频烧录字幕，使用 subtitle_font（字体文件）、
+    subtitle_size（默认 48）和 subtitle_style（默认 白字黑边）。
+    segment_mode 为 scene 时剪辑优先在镜头切换处切分，scene_threshold 为镜头切换分数阈值。
+    audio、watermark、subtitle 操作默认只处理 final_* 视频，prefix 可以改为其他前缀（空字符串表示全部视频）。
+    variants 为拼接生成的版本数（默认 1），每个版本是同一批片段的不同组合，时长都正好等于 concat_time。
+    operations 中 concat 与 header、watermark、audio 同时出现时，默认合并为一次渲染（fused 为 false 时逐步执行）。
+    """
+    source = job.get('source', '')
+    output = job.get('output') or source
+    operations = job.get('operations', ['clip'])
+    unknown = [operation for operation in operations if operation not in JOB_OPERATIONS]
+    if unknown:
+        raise ValueError(f"未知的操作: {', '.join(unknown)}")
+    if 'clip' in operations and not os.path.isdir(source):
+        raise ValueError(f"源文件夹不存在: {source}")
+    if 'concat' in operations and 'concat_time' not in job:
+        raise ValueError("拼接操作需要 concat_time")
+    if 'header' in operations and not job.get('header'):
+        raise ValueError("片头拼接操作需要 header")
+    if 'audio' in operations and not (job.get('music') or job.get('voice')):
+        raise ValueError("背景音乐操作需要 music 或 voice")
+    if 'watermark' in operations and not job.get('watermark'):
+        raise ValueError("水印操作需要 watermark")
+    renderer = None
+    if 'subtitle' in operations:
+        renderer = SubtitleRenderer(job.get('subtitle_font', ''), job.get('subtitle_size', 48),
+                                    job.get('subtitle_style', '白字黑边'))
+    watermark = None
+    if job.get('watermark'):
+        watermark = Watermark(job['watermark'], job.get('watermark_position', '右下'), job.get('watermark_size', '15%'),
+                              os.path.join(output, CACHE_FOLDER_NAME))
+
+    engine = VideoEngine(log=log, progress=progress, events=events, frame_exact=job.get('frame_exact', False),
+                         workers=job.get('workers', workers), seed=job.get('seed'),
+                         transition_duration=job.get('transition', 0), events_path=job.get('events'),
+                         profiles=job.get('profiles'),
+                         watermark=watermark if 'watermark' not in operations else None,
+                         segment_mode=job.get('segment_mode', 'random'),
+                         scene_threshold=job.get('scene_threshold', SCENE_THRESHOLD))
+    prefix = job.get('prefix', 'final_')  # audio、watermark、subtitle 只处理文件名以 prefix 开头的视频
+    os.makedirs(output, exist_ok=True)
+    fused = [operation for operation in operations if operation in ('header', 'watermark', 'audio')]
+    if job.get('fused', True) and 'concat' in operations and fused:
+        # 拼接之后的片头、水印和背景音乐并入拼接的渲染计划，成片只编码一次
+        operations = ['render' if operation == 'concat' else operation
+                      for operation in operations if operation not in fused]
+        engine.watermark = watermark
+    for operation in operations:
+        if operation == 'render':
+            engine.render(output, parse_concat_time(job['concat_time']),
+                          job.get('header', '') if 'header' in fused else '',
+                          job.get('music', '') if 'audio' in fused else '',
+                          job.get('voice', '') if 'audio' in fused else '', job.get('music_volume', 0.3),
+                          job.get('variants', 1))
+            if 'watermark' in fused:
+                engine.watermark = None  # 水印已在渲染中叠加，后续操作不再重复
+        elif operation == 'clip':
+            engine.clip_videos(source, output)
+        elif operation == 'concat':
+            engine.concat_videos(output, parse_concat_time(job['concat_time']), job.get('variants', 1))
+        elif operation == 'header':
+            engine.concat_header(job['header'], output)
+        elif operation == 'audio':
+            engine.mix_audio(output, job.get('music', ''), job.get('voice', ''), job.get('music_volume', 0.3),
+                             prefix=prefix)
+        elif operation == 'watermark':
+            engine.watermark_videos(output, watermark, prefix=prefix)
+        elif operation == 'subtitle':
+            engine.burn_subtitles(output, renderer, prefix=prefix)
+    return engine
+
+
+def remove_partial_outputs(folder):
+    """删除文件夹及其缓存文件夹中被中断的作业留下的临时文件，返回删除的文件数。"""
+    removed = 0
+    for current in (folder, os.path.join(folder, CACHE_FOLDER_NAME)):
+        if not os.path.isdir(current):
+            continue
+        for file_name in os.listdir(current):
+            if file_name.startswith(PARTIAL_PREFIXES) or file_name.endswith(PARTIAL_SUFFIXES):
+                try:
+                    os.remove(os.path.join(current, file_name))
+                    removed += 1
+                except OSError:
+                    pass
+    return removed
+
+
+def run_job_process(job, connection, workers):
+    """在作业进程中执行一个作业，日志、进度、事件和结果通过 connection 发回调度器。"""
+    if hasattr(os, 'setsid'):
+        os.setsid()  # 独立的进程组：暂停、取消时信号同时送到 ffmpeg 和剪辑工作进程
+    lock = threading.Lock()  # 引擎的多个线程共用同一个连接
+
+    def send(kind, payload=None):
+        with lock:
+            connection.send((kind, payload))
+
+    try:
+        run_job(job, log=lambda message: send('log', message), progress=lambda value: send('progress', value),
+                workers=workers, events=lambda event: send('event', event))
+        send('done')
+    except Exception as e:
+        send('failed', str(e))
+    finally:
+        connection.close()
+
+
+class JobScheduler:
+    """按优先级排队执行作业的调度器。
+
+    每个作业在独立的进程组中运行，同时运行的作业占用的核数合计不超过 cpu_budget，输出到同一个文件夹的
+    作业不会同时运行。暂停和继续向作业的整个进程组发送 SIGSTOP/SIGCONT，正在进行的编码立即停下，继续后
+    接着编码；取消时结束整个进程组，并删除输出文件夹中未完成的临时文件。
+    """
+    POLL_INTERVAL = 0.2  # 等待作业消息的最长时间（秒）
+
+    def __init__(self, cpu_budget=0, max_parallel=0, log=None, progress=None, events=None, status=None):
+        self.cpu_budget = cpu_budget or os.cpu_count() or 1
+        self.max_parallel = max_parallel or self.cpu_budget
+        self.job_workers = max(1, self.cpu_budget // (max_parallel or 2))  # 作业没有给出 workers 时占用的核数
+        self.log = log or print
+        self.progress = progress  # progress(作业名, 百分比)
+        self.events = events  # events(作业名, 事件)
+        self.status = status  # status(作业名, 状态)，状态见 JOB_STATES
+        self.failed = []
+        self._lock = threading.RLock()
+        self._queue = []  # (-优先级, 提交序号, 作业名) 组成的堆
+        self._jobs = {}
+        self._sequence = 0
+        self._paused = False
+        self._context = multiprocessing.get_context('spawn')  # 不 fork 带有 Qt 状态的主进程
+
+    def submit(self, job, priority=None):
+        """把作业加入队列，priority 越大越先执行（默认取作业的 priority 字段），返回作业名。"""
+        with self._lock:
+            self._sequence += 1
+            name = job.get('name') or f"job{self._sequence}"
+            if name in self._jobs:
+                name = f"{name}_{self._sequence}"
+            priority = job.get('priority', 0) if priority is None else priority
+            self._jobs[name] = {
+                'job': job,
+                'state': None,
+                'cost': min(self.cpu_budget, job.get('workers') or self.job_workers),
+                'output': os.path.abspath(job.get('output') or job.get('source', '')),
+                'process': None,
+                'connection': None,
+                'error': None,
+            }
+            heapq.heappush(self._queue, (-priority, self._sequence, name))
+            self.set_state(name, 'queued')
+        return name
+
+    def set_state(self, name, state):
+        """记录作业状态并通知调用方。"""
+        self._jobs[name]['state'] = state
+        if self.status:
+            self.status(name, state)
+
+    def pause(self, name=None):
+        """暂停指定作业；name 为 None 时暂停全部作业，并且不再启动新的作业。"""
+        with self._lock:
+            if name is None:
+                self._paused = True
+            for job_name in [name] if name else list(self._jobs):
+                record = self._jobs[job_name]
+                if record['state'] == 'running':
+                    if not SUSPEND_SUPPORTED:
+                        self.log(f"[{job_name}] 当前系统不支持暂停正在运行的作业")
+                        continue
+                    self._signal(record, signal.SIGSTOP)
+                    self.set_state(job_name, 'paused')
+                elif record['state'] == 'queued' and name:
+                    self.set_state(job_name, 'held')
+
+    def resume(self, name=None):
+        """继续指定作业；name 为 None 时继续全部作业。"""
+        with self._lock:
+            if name is None:
+                self._paused = False
+            for job_name in [name] if name else list(self._jobs):
+                record = self._jobs[job_name]
+                if record['state'] == 'paused':
+                    self._signal(record, signal.SIGCONT)
+                    self.set_state(job_name, 'running')
+                elif record['state'] == 'held':
+                    self.set_state(job_name, 'queued')
+
+    def cancel(self, name=None):
+        """取消指定作业；name 为 None 时取消全部作业。排队的作业移出队列，运行中的作业立即结束。"""
+        with self._lock:
+            for job_name in [name] if name else list(self._jobs):
+                record = self._jobs[job_name]
+                if record['state'] in ('queued', 'held'):
+                    self._queue = [item for item in self._queue if item[2] != job_name]
+                    heapq.heapify(self._queue)
+                    self.set_state(job_name, 'cancelled')
+                elif record['state'] in ('running', 'paused'):
+                    self.set_state(job_name, 'cancelled')
+                    self._kill(record)  # 临时文件在进程退出后删除
+
+    def pending(self):
+        """是否还有排队或运行中的作业。"""
+        with self._lock:
+            return any(record['state'] in ('queued', 'held', 'running', 'paused') or record['process'] is not None
+                       for record in self._jobs.values())
+
+    def run(self):
+        """执行队列中的作业直到全部结束（全部暂停时一直等待继续），返回失败的作业名列表。"""
+        while True:
+            with self._lock:
+                self._start_ready()
+                if not self.pending():
+                    break
+                connections = {record['connection']: name for name, record in self._jobs.items()
+                               if record['connection'] is not None}
+            if connections:
+                ready = multiprocessing.connection.wait(list(connections), self.POLL_INTERVAL)
+            else:
+                time.sleep(self.POLL_INTERVAL)
+                ready = []
+            for connection in ready:
+                self._receive(connections[connection])
+            self._reap()
+        return list(self.failed)
+
+    def _start_ready(self):
+        """按优先级启动能放进核数预算的作业，输出到同一个文件夹的作业等前一个结束后再启动。"""
+        if self._paused:
+            return
+        active = [record for record in self._jobs.values() if record['process'] is not None]
+        used = sum(record['cost'] for record in active)
+        busy_outputs = {record['output'] for record in active}
+        for item in sorted(self._queue):
+            if len(active) >= self.max_parallel:
+                break
+            record = self._jobs[item[2]]
+            if record['state'] == 'held' or record['output'] in busy_outputs:
+                continue
+            if active and used + record['cost'] > self.cpu_budget:
+                break  # 不让后面的小作业插队，避免占用核数多的作业一直等不到资源
+            self._queue.remove(item)
+            heapq.heapify(self._queue)
+            self._start(item[2])
+            active.append(record)
+            used += record['cost']
+            busy_outputs.add(record['output'])
+
+    def _start(self, name):
+        """在新的作业进程中启动作业。"""
+        record = self._jobs[name]
+        reader, writer = self._context.Pipe(duplex=False)
+        process = self._context.Process(target=run_job_process, args=(record['job'], writer, record['cost']),
+                                        name=f"vedit-{name}")
+        process.start()
+        writer.close()  # 作业进程退出后读端收到 EOF
+        record['process'] = process
+        record['connection'] = reader
+        self.set_state(name, 'running')
+        self.log(f"[{name}] 作业开始，占用 {record['cost']} 个核")
+
+    def _receive(self, name):
+        """处理作业进程发来的一条消息，连接关闭后不再监听。"""
+        record = self._jobs[name]
+        try:
+            kind, payload = record['connection'].recv()
+        except (EOFError, OSError):
+            record['connection'].close()
+            record['connection'] = None
+            return
+        if kind == 'log':
+            self.log(f"[{name}] {payload}")
+        elif kind == 'progress' and self.progress:
+            self.progress(name, payload)
+        elif kind == 'event' and self.events:
+            self.events(name, payload)
+        elif kind == 'failed':
+            record['error'] = payload
+
+    def _reap(self):
+        """回收已经退出的作业进程并记录结果，被取消的作业删除未完成的临时文件。"""
+        with self._lock:
+            for name, record in self._jobs.items():
+                process = record['process']
+                if process is None or process.is_alive():
+                    continue
+                while record['connection'] is not None and record['connection'].poll():
+                    self._receive(name)  # 读完进程退出前发出的消息
+                if record['connection'] is not None:
+                    record['connection'].close()
+                    record['connection'] = None
+                process.join()
+                record['process'] = None
+                if record['state'] == 'cancelled':
+                    removed = remove_partial_outputs(record['output'])
+                    self.log(f"[{name}] 作业已取消，删除了 {removed} 个临时文件")
+                elif process.exitcode == 0 and record['error'] is None:
+                    self.set_state(name, 'done')
+                    self.log(f"[{name}] 作业完成")
+                else:
+                    self.set_state(name, 'failed')
+                    self.failed.append(name)
+                    self.log(f"[{name}] 作业失败: {record['error'] or f'进程退出码 {process.exitcode}'}")
+
+    def _signal(self, record, signum):
+        """向作业的进程组发送信号，进程组还没建立时只发给作业进程。"""
+        pid = record['process'].pid
+        try:
+            os.killpg(pid, signum)
+        except ProcessLookupError:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass  # 进程已经退出
+
+    def _kill(self, record):
+        """立即结束作业的整个进程组，暂停中的进程也会被结束。"""
+        if hasattr(os, 'killpg'):
+            self._signal(record, signal.SIGKILL)
+        else:
+            record['process'].terminate()
+
+
+def run_jobs(jobs, max_parallel=1, log=print, cpu_budget=0):
+    """按作业的 priority 字段排队，同时最多运行 max_parallel 个作业，返回失败的作业名列表。
+
+    按 Ctrl+C 时取消所有作业并删除未完成的临时文件。
+    """
+    scheduler = JobScheduler(cpu_budget, max_parallel, log=log)
+    for job in jobs:
+        scheduler.submit(job)
+    try:
+        return scheduler.run()
+    except KeyboardInterrupt:
+        log("正在取消所有作业...")
+        scheduler.cancel()
+        scheduler.run()
+        raise